@@ -0,0 +1,57 @@
+"""
+Benchmark: peak memory of done records for a crawl of n urls, from
+storing the records to handing them to the writer.
+
+    python benchmarks/bench_done.py [count of urls, default 1000000]
+"""
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+from pysitemap.backends.done import DoneRecord, DoneStore
+
+URL = 'https://www.example.com/blog/{}/some-article-title-{}'
+LASTMODS = ['Mon, 02 Jan 2023 10:00:00 GMT', 'Tue, 03 Jan 2023 10:00:00 GMT']
+IMAGE = {'src': 'https://www.example.com/photos/{}.jpg', 'title': 'Photo'}
+
+
+def legacy(count):
+    # dict of five element lists, then a full list for the writer
+    done = {}
+    for i in range(count):
+        imgs = [dict(IMAGE, src=IMAGE['src'].format(i))] if i % 10 == 0 else []
+        # Header values are new strings for every response
+        lastmod = ''.join(LASTMODS[i % 2])
+        done[URL.format(i % 100, i)] = [True, lastmod, 'weekly', 0.5, imgs]
+    items = [(key, value) for key, value in done.items() if key and value]
+    return sum(1 for _ in items)
+
+
+def store(factory, count):
+    done = factory()
+    for i in range(count):
+        imgs = [dict(IMAGE, src=IMAGE['src'].format(i))] if i % 10 == 0 else []
+        lastmod = ''.join(LASTMODS[i % 2])
+        done[URL.format(i % 100, i)] = DoneRecord(True, lastmod, 'weekly', 0.5, imgs)
+    return sum(1 for _ in ((url, record) for url, record in done.items() if url))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{} urls'.format(count))
+    for name, func in (
+            ('dict + list', legacy),
+            ('DoneStore in memory', partial(store, partial(DoneStore, memory_limit=None))),
+            ('DoneStore 32 MiB', partial(store, partial(DoneStore, memory_limit=32 * 1024 * 1024)))):
+        tracemalloc.start()
+        started = time.perf_counter()
+        written = func(count)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{:22} peak {:8.1f} MiB {:7.2f}s written {}'.format(name, peak / 1024 / 1024, seconds, written))
+
+
+if __name__ == '__main__':
+    main()
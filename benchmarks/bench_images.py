@@ -0,0 +1,50 @@
+"""
+Benchmark: image deduplication with the old list of tag dictionaries
+against backends.images.ImageRegistry, for growing counts of images.
+
+    python benchmarks/bench_images.py
+"""
+import time
+
+from pysitemap.backends.images import ImageRegistry
+
+SRC = 'https://www.example.com/photos/{}/{}.jpg'
+
+
+def tags(count):
+    # Every image is found on three pages
+    for i in range(3 * count):
+        n = i % count
+        yield 'https://www.example.com/page/{}'.format(i), {'src': SRC.format(n % 100, n), 'title': 'Photo {}'.format(n)}
+
+
+def legacy(count):
+    done_list = []
+    for _page, tag in tags(count):
+        if tag not in done_list:
+            done_list.append(tag)
+    return len(done_list)
+
+
+def registry(count):
+    done_images = ImageRegistry()
+    for page, tag in tags(count):
+        done_images.add(page, tag)
+    return len(done_images)
+
+
+def main():
+    for count in (1000, 2000, 4000, 8000, 300000):
+        line = '{:7} images'.format(count)
+        for name, func in (('list', legacy), ('registry', registry)):
+            if name == 'list' and count > 10000:
+                line += '  {}: {:>9}'.format(name, 'skipped')
+                continue
+            started = time.perf_counter()
+            func(count)
+            line += '  {}: {:8.3f}s'.format(name, time.perf_counter() - started)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
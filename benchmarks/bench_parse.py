@@ -0,0 +1,70 @@
+"""
+Benchmark: pages parsed per second on the event loop and in process
+pools of 1..n workers, with the worst event loop stall while parsing.
+
+    python benchmarks/bench_parse.py [count of pages] [images per page] [max workers]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pysitemap.parsers import IMAGE_FIELDS, parse_document
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_tags import make_page  # noqa: E402
+
+TAG_FIELDS = {'img': IMAGE_FIELDS}
+
+
+async def ticker(stalls):
+    # Longest time the loop could not run a 1 ms timer
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def parse_all(corpus, executor):
+    loop = asyncio.get_event_loop()
+    stalls = [0]
+    tick = asyncio.ensure_future(ticker(stalls))
+    started = time.perf_counter()
+    if executor is None:
+        for page in corpus:
+            parse_document(page, TAG_FIELDS)
+            await asyncio.sleep(0)
+    else:
+        await asyncio.gather(*(loop.run_in_executor(executor, parse_document, page, TAG_FIELDS)
+                               for page in corpus))
+    seconds = time.perf_counter() - started
+    tick.cancel()
+    return seconds, max(stalls)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    images = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    random.seed(0)
+    corpus = [make_page(images).encode('utf-8') for _ in range(pages)]
+    size = sum(len(page) for page in corpus) / 1024 / 1024
+    print('corpus: {} pages of {:.0f} KiB, {} cpus'.format(pages, size * 1024 / pages, os.cpu_count()))
+
+    runs = [('event loop', None, 0), ('1 thread', ThreadPoolExecutor(1), 1)]
+    runs += [('{} processes'.format(n), ProcessPoolExecutor(n), n) for n in range(1, workers + 1)]
+    for name, executor, count in runs:
+        if executor is not None:
+            # Start the workers before timing
+            list(executor.map(abs, range(count)))
+        seconds, stall = asyncio.run(parse_all(corpus, executor))
+        if executor is not None:
+            executor.shutdown()
+        print('{:13} {:8.0f} pages/s {:7.2f} MiB/s  worst loop stall {:7.1f} ms'.format(
+            name, pages / seconds, size / seconds, stall * 1000))
+
+
+if __name__ == '__main__':
+    main()
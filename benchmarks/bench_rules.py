@@ -0,0 +1,74 @@
+"""
+Microbenchmark: url rule matching of the old Crawler.contains()/urldict()
+loop against pysitemap.rules.
+
+    python benchmarks/bench_rules.py [count of urls]
+"""
+import random
+import re
+import sys
+import timeit
+
+from pysitemap.rules import PatternSet, FirstMatchTable
+
+EXCLUDE_URLS = [
+    '/git/.*(action|commit|stars|activity|followers|following|\\?sort|issues|pulls|milestones|archive|/labels$|/wiki$|/releases$|/forks$|/watchers$)',
+    '/git/user/(sign_up|login|forgot_password)',
+    '/css',
+    '/js',
+    'favicon',
+    '[a-zA-Z0-9]*\\.[a-zA-Z0-9]*$',
+    '\\?\\.php',
+]
+CHANGEFREQ = {'/git/': 'weekly', '/photos/': 'monthly', '/': 'yearly'}
+
+
+def contains(url, regex, rlist=True):
+    # Crawler.contains() before the rule engine
+    if rlist:
+        for exc in regex:
+            if bool(re.search(re.compile(r"{}".format(exc)), url)):
+                return True
+        return False
+    return bool(re.search(re.compile(r"{}".format(regex)), url))
+
+
+def urldict(url, url_dict):
+    for urlkey, regvalue in url_dict.items():
+        if contains(url, urlkey, rlist=False):
+            return regvalue
+    return None
+
+
+def make_urls(count):
+    random.seed(0)
+    paths = ['git/repo{}/src', 'photos/{}', 'blog/post-{}', 'git/repo{}/issues', 'page/{}']
+    # Links are discovered many times over, about a tenth are unique
+    unique = ['https://example.com/' + random.choice(paths).format(i) for i in range(count // 10)]
+    return [random.choice(unique) for _ in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    urls = make_urls(count)
+
+    def legacy():
+        for url in urls:
+            if not contains(url, EXCLUDE_URLS):
+                urldict(url, CHANGEFREQ)
+
+    excludes = PatternSet(EXCLUDE_URLS)
+    changefreq = FirstMatchTable(CHANGEFREQ)
+
+    def engine():
+        for url in urls:
+            if url not in excludes:
+                changefreq.lookup(url)
+
+    for name, func in (('legacy', legacy), ('rules', engine)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print('{:8} {:8.3f}s {:12.0f} urls/s'.format(name, seconds, count / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark: memory and false positive rate of seen-url sets.
+
+Adds n urls, then looks up n other urls which were never added; every
+hit among those is a false positive.
+
+    python benchmarks/bench_seen.py [count of urls, default 10000000]
+"""
+import sys
+import time
+import tracemalloc
+
+from pysitemap.backends.fingerprint import FingerprintSet, BloomFilter
+
+URL = 'https://shop.example.com/catalog/shoes?color={}&size={}&sort=price'
+
+
+def measure(name, factory, count):
+    tracemalloc.start()
+    started = time.perf_counter()
+    seen = factory()
+    for i in range(count):
+        seen.add(URL.format(i, 'm'))
+    added = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    false_positives = sum(1 for i in range(count) if URL.format(i, 'xl') in seen)
+    looked_up = time.perf_counter() - started
+
+    print('{:22} {:9.1f} MiB {:6.1f} B/url  fp rate {:.2e}  add {:7.0f}/s  lookup {:7.0f}/s'.format(
+        name, memory / 1024 / 1024, memory / count, false_positives / count,
+        count / added, count / looked_up))
+    del seen
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    print('{} urls'.format(count))
+    measure('set', set, count)
+    measure('FingerprintSet', lambda: FingerprintSet(capacity=count), count)
+    measure('FingerprintSet+bloom', lambda: FingerprintSet(capacity=count, bloom_capacity=count), count)
+    measure('BloomFilter 1%', lambda: BloomFilter(count, 0.01), count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: pages crawled per second by 1..n processes from a local
+stand-in site of parse heavy pages. The site runs in its own process.
+
+    python benchmarks/bench_sharded.py [count of pages] [max processes]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+import pysitemap
+
+PORT = 8799
+FILLER = '<p>{}</p>\n'.format('lorem <b>ipsum</b> dolor sit amet ' * 20) * 100
+
+
+def serve(pages):
+    async def page(request):
+        i = int(request.match_info.get('i', 0))
+        links = ''.join('<a href="/p/{}">x</a>\n'.format((i * 7 + k) % pages) for k in range(1, 11))
+        return web.Response(text='<html><body>{}{}</body></html>'.format(FILLER, links), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/', page)
+    app.router.add_get('/p/{i}', page)
+    web.run_app(app, host='127.0.0.1', port=PORT, print=None)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    site = multiprocessing.Process(target=serve, args=(pages,), daemon=True)
+    site.start()
+    time.sleep(1)
+    print('{} pages of {:.0f} KiB, {} cpus'.format(pages, len(FILLER) / 1024, os.cpu_count()))
+    devnull = open(os.devnull, 'w')
+    with tempfile.TemporaryDirectory() as directory:
+        for count in range(1, processes + 1):
+            started = time.perf_counter()
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                pysitemap.crawler('http://127.0.0.1:{}/'.format(PORT), os.path.join(directory, 'sitemap.xml'),
+                                  maxtasks=20, findimages=False, processes=count)
+            finally:
+                sys.stdout = stdout
+            seconds = time.perf_counter() - started
+            print('{:2} processes {:8.0f} pages/s'.format(count, pages / seconds))
+    site.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: image tag extraction of the old regex based Crawler.fetchtags()
+against the single pass pysitemap.parsers.LinkParser tokenizer.
+
+The corpus is generated: image heavy pages with quoted, unquoted and
+entity escaped attribute values, spread over many lines.
+
+    python benchmarks/bench_tags.py [count of pages] [images per page]
+"""
+import random
+import re
+import sys
+import timeit
+
+from pysitemap.parsers import LinkParser, IMAGE_FIELDS
+
+
+def legacy_fetchtags(data, tag_input, fields):
+    # Crawler.fetchtags() before the tokenizer, without the async wrapper
+    tags = []
+    tags_raw = re.findall(re.compile(r'<{}.*?>'.format(tag_input)), ' '.join(data.split('\n')))
+    for tag_raw in tags_raw:
+        tag_raw = re.sub(re.compile(r'<{}(.*?)>'.format(tag_input)), '\\1', tag_raw)
+        args_raw = re.findall(r'(?i)(?=[\w]+[=]|[\w\"\'])(.*?)(?=\s[\w]+[=])', tag_raw)
+        for arg_raw in args_raw:
+            arg = arg_raw.split('=')
+            if len(arg) != 2:
+                continue
+            arg_dict = {}
+            value = re.sub(r'^["\']?(.*?)["\']?$', '\\1', arg[1])
+            value = re.sub(r'&', '&amp;', value)
+            for field in fields:
+                if arg[0] == field:
+                    arg_dict[field] = value
+            if len(arg_dict) == 1:
+                tags.append(arg_dict)
+    return tags
+
+
+def make_page(images):
+    parts = ['<html><head><title>bench</title></head><body>']
+    for i in range(images):
+        parts.append('<p>{}</p>\n'.format('lorem ipsum ' * random.randint(5, 40)))
+        parts.append(
+            '<img src="/photos/{0}.jpg" title="Photo {0} &amp; more"\n'
+            ' alt=\'image {0}\' width=640 height=480 caption="caption {0}">\n'.format(i))
+        parts.append('<a href="/gallery/{0}">gallery</a>\n'.format(i))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    images = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    random.seed(0)
+    corpus = [make_page(images) for _ in range(pages)]
+    size = sum(len(page) for page in corpus) / 1024 / 1024
+
+    def legacy():
+        for page in corpus:
+            legacy_fetchtags(page, 'img', IMAGE_FIELDS)
+
+    def tokenizer():
+        for page in corpus:
+            parser = LinkParser(tag_fields={'img': IMAGE_FIELDS})
+            parser.feed(page)
+            parser.close()
+            parser.pop_tags()
+
+    print('corpus: {} pages, {} images per page, {:.1f} MiB'.format(pages, images, size))
+    for name, func in (('legacy', legacy), ('tokenizer', tokenizer)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print('{:10} {:8.3f}s {:8.2f} MiB/s {:8.0f} pages/s'.format(name, seconds, size / seconds, pages / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: sitemap write throughput, one awaited write per entry with
+concatenated strings against the buffered XMLWriter.
+
+    python benchmarks/bench_writer.py [count of urls, default 1000000]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+
+from aiofile import AIOFile, Writer
+
+from pysitemap.backends.done import DoneRecord
+from pysitemap.format_processors.xml import XMLWriter
+
+URL = 'https://www.example.com/blog/{}/some-article-title-{}?page=1&sort=date'
+LASTMODS = ['Mon, 02 Jan 2023 10:00:00 GMT', 'Tue, 03 Jan 2023 10:00:00 GMT']
+IMAGE = {'src': 'https://www.example.com/photos/{}.jpg', 'title': 'Photo'}
+
+
+def entries(count):
+    for i in range(count):
+        imgs = [dict(IMAGE, src=IMAGE['src'].format(i))] if i % 10 == 0 else []
+        yield URL.format(i % 100, i), DoneRecord(True, LASTMODS[i % 2], 'weekly', 0.5, imgs)
+
+
+async def legacy(filename, count):
+    writer = XMLWriter(filename)
+    async with AIOFile(filename, 'w') as aiodf:
+        write = Writer(aiodf)
+        await write(writer.header())
+        await aiodf.fsync()
+        for url, record in entries(count):
+            data = "<loc>{}</loc>".format(url)
+            timestamp = datetime.strptime(record.lastmod, "%a, %d %b %Y %H:%M:%S %Z").astimezone(
+                tz=timezone(timedelta(hours=0))).isoformat()
+            data += "<lastmod>{}</lastmod>".format(str(timestamp))
+            data += "<changefreq>{}</changefreq>".format(str(record.changefreq))
+            data += "<priority>{}</priority>".format(str(record.priority))
+            for image in record.images:
+                data += "<image:image><image:loc>{}</image:loc><image:title>{}</image:title></image:image>".format(
+                    image['src'], image['title'])
+            await write('<url>{}</url>\n'.format(data))
+        await aiodf.fsync()
+        await write(writer.footer())
+        await aiodf.fsync()
+
+
+async def buffered(filename, count):
+    await XMLWriter(filename, max_urls=count, max_bytes=1 << 40).write(entries(count))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{} urls'.format(count))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'sitemap.xml')
+        for name, func in (('per entry await', legacy), ('buffered', buffered)):
+            started = time.perf_counter()
+            asyncio.run(func(filename, count))
+            seconds = time.perf_counter() - started
+            size = os.path.getsize(filename)
+            print('{:16} {:7.2f}s {:10.0f} urls/s {:7.1f} MiB/s'.format(
+                name, seconds, count / seconds, size / seconds / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
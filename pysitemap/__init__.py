@@ -1,18 +1,25 @@
 import asyncio
 import signal
 from pysitemap.base_crawler import Crawler
+from pysitemap.sharded import Coordinator
 
 
 def crawler(
     root_url, out_file, out_format='xml',
     maxtasks=10, exclude_urls=[], exclude_imgs=[], image_root_urls=[],
     use_lastmodified=True, verifyssl=True, findimages=True, images_this_domain=True,
-    headers=None, timezone_offset=0, changefreq=None, priorities=None):
+    headers=None, timezone_offset=0, changefreq=None, priorities=None,
+    max_body_size=10 * 1024 * 1024, image_probe='head', limit_per_host=0, request_timeout=30,
+    delay=0, adaptive_concurrency=True, state_file=None, stream_output=False, sitemap_max_urls=50000,
+    sitemap_max_bytes=50 * 1024 * 1024, sitemap_base_url=None, compresslevel=6,
+    incremental=False, merge_existing=False, seed_sitemaps=False, use_robots=False,
+    parse_executor=None, parse_workers=None, parse_threshold=256 * 1024, processes=1,
+    verbose=True, progress_interval=10, metrics_port=None):
     """
     run crowler
     :param root_url: Site root url
     :param out_file: path to the out file
-    :param out_format: format of out file [xml, txt]
+    :param out_format: format of out file [xml, txt, xml.gz, txt.gz]
     :param maxtasks: max count of tasks
     :param exclude_urls: excludable url paths
     :param exclude_imgs: excludable img url paths
@@ -25,23 +32,70 @@ def crawler(
     :param timezone_offset: timezone offset for lastmod tags
     :param changefreq: dictionary, where key is site sub url regex, and value is changefreq
     :param priorities: dictionary, where key is site sub url regex, and value is priority float
+    :param max_body_size: read at most this many bytes of a page, None for no limit
+    :param image_probe: how image mimetypes are checked [head | get]
+    :param limit_per_host: maximum count of connections per host, 0 for no limit
+    :param request_timeout: total seconds per request
+    :param delay: minimum seconds between two requests to the same host
+    :param adaptive_concurrency: lower concurrency automatically on slow responses, errors and 429/503?
+    :param state_file: SQLite file keeping crawl state; an interrupted crawl (crash, SIGINT) is resumed from it
+    :param stream_output: write entries while the crawl runs instead of at the end
+    :param sitemap_max_urls: maximum count of urls per sitemap file, more are split into shards and a sitemap index
+    :param sitemap_max_bytes: maximum size of sitemap file
+    :param sitemap_base_url: url the sitemap files are published under, default root_url
+    :param compresslevel: gzip compression level of xml.gz and txt.gz output, 1-9
+    :param incremental: fetch pages conditionally (ETag, Last-Modified) and reuse the state_file data of unchanged ones
+    :param merge_existing: update the sitemap at out_file: replace entries of crawled urls, drop failed ones, keep others
+    :param seed_sitemaps: queue urls of the sitemaps in robots.txt (True) and of a list of sitemap urls first
+    :param use_robots: obey robots.txt rules and Crawl-delay of the site
+    :param parse_executor: parse pages off the event loop: 'thread', 'process' or an Executor instance
+    :param parse_workers: worker count of a 'thread' or 'process' parse pool, default count of CPUs
+    :param parse_threshold: pages smaller than this many bytes are parsed on the event loop
+    :param processes: crawl with this many processes, each owning a part of the url space; maxtasks is per process.
+        state_file is not supported with more than one process
+    :param verbose: print every url when it is processed
+    :param progress_interval: seconds between progress lines with counts and phase timings, None for none
+    :param metrics_port: serve Prometheus metrics at http://127.0.0.1:metrics_port/metrics during the crawl;
+        process N of a multi-process crawl uses metrics_port + N
     :return:
     """
-    loop = asyncio.get_event_loop()
+    options = dict(
+        out_file=out_file, out_format=out_format,
+        maxtasks=maxtasks, exclude_urls=exclude_urls, exclude_imgs=exclude_imgs,
+        image_root_urls=image_root_urls, use_lastmodified=use_lastmodified, verifyssl=verifyssl,
+        findimages=findimages, images_this_domain=images_this_domain, headers=headers,
+        timezone_offset=timezone_offset, changefreq=changefreq, priorities=priorities,
+        max_body_size=max_body_size, image_probe=image_probe, limit_per_host=limit_per_host,
+        request_timeout=request_timeout, delay=delay, adaptive_concurrency=adaptive_concurrency,
+        state_file=state_file, stream_output=stream_output, sitemap_max_urls=sitemap_max_urls,
+        sitemap_max_bytes=sitemap_max_bytes, sitemap_base_url=sitemap_base_url,
+        compresslevel=compresslevel, incremental=incremental,
+        merge_existing=merge_existing, seed_sitemaps=seed_sitemaps,
+        use_robots=use_robots, parse_executor=parse_executor, parse_workers=parse_workers,
+        parse_threshold=parse_threshold, verbose=verbose, progress_interval=progress_interval,
+        metrics_port=metrics_port)
 
-    c = Crawler(root_url, out_file=out_file, out_format=out_format,
-                maxtasks=maxtasks, exclude_urls=exclude_urls, exclude_imgs=exclude_imgs,
-                image_root_urls=image_root_urls, use_lastmodified=use_lastmodified, verifyssl=verifyssl,
-                findimages=findimages, images_this_domain=images_this_domain, headers=headers,
-                timezone_offset=timezone_offset, changefreq=changefreq, priorities=priorities)
+    if processes > 1:
+        coordinator = Coordinator(processes, root_url, **options)
+        coordinator.run()
+        print('done:', len(coordinator.crawler.done), '; ok:',
+              sum(record.ok for record in coordinator.crawler.done.values()))
+        print('image probe bytes saved:', coordinator.probe_bytes_saved)
+        return
 
-    loop.run_until_complete(c.run())
+    loop = asyncio.get_event_loop()
+    c = Crawler(root_url, **options)
 
     try:
-        loop.add_signal_handler(signal.SIGINT, loop.stop)
-    except RuntimeError:
+        loop.add_signal_handler(signal.SIGINT, c.stop)
+    except (NotImplementedError, RuntimeError):
         pass
+
+    loop.run_until_complete(c.run())
     print('todo_queue:', len(c.todo_queue))
     print('busy:', len(c.busy))
-    print('done:', len(c.done), '; ok:', sum(list(zip(*c.done.values()))[0]) )
+    print('done:', len(c.done), '; ok:', sum(record.ok for record in c.done.values()))
     print('tasks:', len(c.tasks))
+    print('image probe bytes saved:', c.probe_bytes_saved)
+    if c.incremental:
+        print('not modified:', c.not_modified)
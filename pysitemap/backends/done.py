@@ -0,0 +1,158 @@
+import json
+import sqlite3
+import sys
+import tempfile
+
+
+class DoneRecord(object):
+    """
+    Result of a processed url
+    """
+    __slots__ = ('ok', 'lastmod', 'changefreq', 'priority', 'images')
+
+    def __init__(self, ok, lastmod=None, changefreq=None, priority=None, images=()):
+        """
+        :param ok: was the url fetched without errors?
+        :param lastmod: Last-Modified header value
+        :param changefreq: changefreq value
+        :param priority: priority value
+        :param images: image tag dictionaries found on the page
+        """
+        self.ok = ok
+        # lastmod headers repeat a lot across a site, keep one copy of each value
+        self.lastmod = None if lastmod is None else sys.intern(lastmod)
+        self.changefreq = changefreq
+        self.priority = priority
+        self.images = tuple(images)
+
+    def __repr__(self):
+        return "<DoneRecord ok={} lastmod={} changefreq={} priority={} images={}>".format(
+            self.ok, self.lastmod, self.changefreq, self.priority, len(self.images))
+
+    def to_row(self):
+        return (int(self.ok), self.lastmod, self.changefreq,
+                None if self.priority is None else json.dumps(self.priority),
+                json.dumps(self.images) if self.images else None)
+
+    @classmethod
+    def from_row(cls, ok, lastmod, changefreq, priority, images):
+        return cls(bool(ok), lastmod, changefreq,
+                   None if priority is None else json.loads(priority),
+                   json.loads(images) if images else ())
+
+    def memory_size(self):
+        """
+        Rough count of bytes held by the record
+        """
+        return 120 + sum(200 + sum(len(value) for value in image.values()) for image in self.images)
+
+
+class DoneStore(object):
+    """
+    Mapping of url -> DoneRecord which moves records into a temporary
+    SQLite file once their estimated size passes memory_limit.
+
+    items() and values() iterate lazily, spilled records first.
+    """
+
+    def __init__(self, memory_limit=256 * 1024 * 1024, batch_size=10000):
+        """
+        :param memory_limit: bytes of records kept in memory before they are spilled to disk, None for no limit
+        :type memory_limit: int
+        :param batch_size: count of rows fetched per read when iterating spilled records
+        :type batch_size: int
+        """
+        self.memory_limit = memory_limit
+        self.batch_size = batch_size
+        self.memory = {}
+        self.memory_size = 0
+        self.spilled = 0
+        self.connection = None
+
+    def _open(self):
+        self.file = tempfile.NamedTemporaryFile(prefix='pysitemap-done-', suffix='.db')
+        self.connection = sqlite3.connect(self.file.name)
+        self.connection.execute("PRAGMA journal_mode=OFF;")
+        self.connection.execute("PRAGMA synchronous=OFF;")
+        self.connection.execute("""
+            CREATE TABLE done (
+                url text primary key,
+                ok integer,
+                lastmod text,
+                changefreq text,
+                priority text,
+                images text
+            );
+        """)
+
+    def spill(self):
+        """
+        Move records kept in memory to disk
+        """
+        if self.connection is None:
+            self._open()
+        self.connection.executemany(
+            """insert or replace into done values (?, ?, ?, ?, ?, ?);""",
+            ((url,) + record.to_row() for url, record in self.memory.items()))
+        self.connection.commit()
+        self.spilled = self.connection.execute("""select count(*) from done;""").fetchone()[0]
+        self.memory = {}
+        self.memory_size = 0
+
+    def _disk_get(self, url):
+        if self.connection is None:
+            return None
+        row = self.connection.execute(
+            """select ok, lastmod, changefreq, priority, images from done where url = ?;""", (url,)).fetchone()
+        return None if row is None else DoneRecord.from_row(*row)
+
+    def __setitem__(self, url, record):
+        self.memory[url] = record
+        self.memory_size += sys.getsizeof(url) + record.memory_size()
+        if self.memory_limit is not None and self.memory_size > self.memory_limit:
+            self.spill()
+
+    def __getitem__(self, url):
+        record = self.memory.get(url)
+        if record is None:
+            record = self._disk_get(url)
+        if record is None:
+            raise KeyError(url)
+        return record
+
+    def get(self, url, default=None):
+        try:
+            return self[url]
+        except KeyError:
+            return default
+
+    def __contains__(self, url):
+        return url in self.memory or self._disk_get(url) is not None
+
+    def __len__(self):
+        # A spilled url set again is counted twice until the next spill
+        return self.spilled + len(self.memory)
+
+    def __iter__(self):
+        for url, _record in self.items():
+            yield url
+
+    def items(self):
+        if self.connection is not None:
+            cursor = self.connection.execute(
+                """select url, ok, lastmod, changefreq, priority, images from done;""")
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    # A record set again after spilling is kept in memory
+                    if row[0] not in self.memory:
+                        yield row[0], DoneRecord.from_row(*row[1:])
+        # Records are read once the workers stopped or before they start, a
+        # copy of the in-memory part would double its memory at the end
+        yield from self.memory.items()
+
+    def values(self):
+        for _url, record in self.items():
+            yield record
@@ -0,0 +1,169 @@
+import hashlib
+import math
+from array import array
+
+# Slot markers of FingerprintSet, real fingerprints are moved out of this range
+EMPTY = 0
+DELETED = 1
+
+
+def fingerprint(url):
+    """
+    64-bit fingerprint of url
+    """
+    value = int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value if value > DELETED else value + 2
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over url fingerprints.
+
+    Needs -ln(error_rate) / ln(2)^2 bits per url: 9.6 bits (1.2 bytes) at
+    1% false positives, 14.4 bits at 0.1%. Urls can not be removed; a
+    false positive means a new url is taken for a seen one and skipped.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        """
+        :param capacity: expected count of urls
+        :type capacity: int
+        :param error_rate: false positive rate at capacity
+        :type error_rate: float
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fp):
+        # Double hashing: k positions from the two halves of the fingerprint
+        h1, h2 = fp & 0xffffffff, fp >> 32 | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add_fingerprint(self, fp):
+        for pos in self._positions(fp):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def has_fingerprint(self, fp):
+        for pos in self._positions(fp):
+            if not self.bits[pos >> 3] & 1 << (pos & 7):
+                return False
+        return True
+
+    def add(self, url):
+        fp = fingerprint(url)
+        if not self.has_fingerprint(fp):
+            self.count += 1
+            self.add_fingerprint(fp)
+
+    def __contains__(self, url):
+        return self.has_fingerprint(fingerprint(url))
+
+    def __len__(self):
+        return self.count
+
+
+class FingerprintSet(object):
+    """
+    Set of urls kept as 64-bit fingerprints in an open addressing hash
+    table backed by array('Q').
+
+    A slot costs 8 bytes and the table is at most max_load full, so a url
+    takes 11.5-23 bytes (10M urls: 2^24 slots, 128 MiB) against more than
+    100 bytes for a str in a set. Two urls share a fingerprint with
+    probability about n^2 / 2^65: 2.7e-6 for all of 10M urls together.
+
+    The optional Bloom filter front answers most lookups of new urls
+    without probing the table. Urls can be added and removed, but not
+    iterated, so it fits the seen set and todo_queue_backend.
+    """
+
+    def __init__(self, capacity=1024, max_load=0.7, bloom_capacity=None, bloom_error_rate=0.01):
+        """
+        :param capacity: expected count of urls, the table grows beyond it
+        :type capacity: int
+        :param max_load: table fill ratio which triggers growing
+        :type max_load: float
+        :param bloom_capacity: expected count of urls for the Bloom filter front, None for no filter
+        :type bloom_capacity: int
+        :param bloom_error_rate: false positive rate of the Bloom filter
+        :type bloom_error_rate: float
+        """
+        self.max_load = max_load
+        self.count = 0
+        self.used = 0
+        self._allocate(capacity)
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity else None
+
+    def _allocate(self, capacity):
+        size = 8
+        while size * self.max_load < capacity:
+            size *= 2
+        self.table = array('Q', bytes(8 * size))
+        self.mask = size - 1
+
+    def _grow(self):
+        old = self.table
+        self._allocate(2 * self.count + 1)
+        self.used = 0
+        for fp in old:
+            if fp > DELETED:
+                self.table[self._find(fp, insert=True)] = fp
+                self.used += 1
+
+    def _find(self, fp, insert=False):
+        """
+        Index of fp in the table, or of the slot to insert it into; -1 if
+        fp is missing and insert is False
+        """
+        table, mask = self.table, self.mask
+        i = fp & mask
+        free = -1
+        while True:
+            slot = table[i]
+            if slot == fp:
+                return i
+            if slot == EMPTY:
+                if not insert:
+                    return -1
+                return i if free < 0 else free
+            if slot == DELETED and free < 0:
+                free = i
+            i = (i + 1) & mask
+
+    def add(self, url):
+        fp = fingerprint(url)
+        i = self._find(fp, insert=True)
+        if self.table[i] == fp:
+            return
+        if self.table[i] == EMPTY:
+            self.used += 1
+        self.table[i] = fp
+        self.count += 1
+        if self.bloom is not None:
+            self.bloom.add_fingerprint(fp)
+        if self.used > self.max_load * len(self.table):
+            self._grow()
+
+    def discard(self, url):
+        i = self._find(fingerprint(url))
+        if i >= 0:
+            self.table[i] = DELETED
+            self.count -= 1
+
+    def remove(self, url):
+        i = self._find(fingerprint(url))
+        if i < 0:
+            raise KeyError(url)
+        self.table[i] = DELETED
+        self.count -= 1
+
+    def __contains__(self, url):
+        fp = fingerprint(url)
+        if self.bloom is not None and not self.bloom.has_fingerprint(fp):
+            return False
+        return self._find(fp) >= 0
+
+    def __len__(self):
+        return self.count
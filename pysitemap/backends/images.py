@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import tempfile
+import urllib.parse
+
+
+def normalize_src(src):
+    """
+    Image url as registry key: lowercase scheme and host, no fragment
+    """
+    parts = urllib.parse.urlsplit(src.strip())
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+
+class ImageRegistry(object):
+    """
+    Images found during the crawl, indexed by normalized src.
+
+    Keeps the metadata of the first tag seen for an image and the pages
+    it was found on. Membership checks are O(1).
+    """
+
+    def __init__(self, field='src'):
+        """
+        :param field: tag field holding the image url
+        :type field: str
+        """
+        self.field = field
+        self.images = {}
+        self.pages = {}
+
+    def add(self, page_url, tag):
+        """
+        Register image tag found on page_url
+        :return: True if the image was not seen before
+        """
+        src = normalize_src(tag[self.field])
+        self.pages.setdefault(src, []).append(page_url)
+        if src in self.images:
+            return False
+        self.images[src] = tag
+        return True
+
+    def get(self, src):
+        return self.images.get(normalize_src(src))
+
+    def pages_of(self, src):
+        return self.pages.get(normalize_src(src), [])
+
+    def __contains__(self, src):
+        return normalize_src(src) in self.images
+
+    def __len__(self):
+        return len(self.images)
+
+    def __iter__(self):
+        return iter(self.images.values())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteImageRegistry(object):
+    """
+    ImageRegistry kept in a SQLite file, for crawls with more images than
+    fit in memory. Usable as Crawler(done_images=SQLiteImageRegistry)
+    """
+
+    def __init__(self, db_name=None, field='src', batch_size=1000, reset=True):
+        """
+        :param db_name: path to the database file, a temporary file removed with the registry if None
+        :type db_name: str
+        :param field: tag field holding the image url
+        :type field: str
+        :param batch_size: count of writes per commit
+        :type batch_size: int
+        :param reset: forget images of a previous crawl? Images left in the file count as found,
+            they are not listed again
+        :type reset: bool
+        """
+        self.field = field
+        self.batch_size = batch_size
+        self.pending = 0
+        self.file = None
+        if db_name is None:
+            self.file = tempfile.NamedTemporaryFile(prefix='pysitemap-images-', suffix='.db')
+            db_name = self.file.name
+        self.connection = sqlite3.connect(db_name)
+        self.__init_tables()
+        if reset:
+            self.reset()
+
+    def __init_tables(self):
+        cursor = self.connection.cursor()
+        if self.file is None:
+            cursor.execute("PRAGMA journal_mode=WAL;")
+        else:
+            # Nothing to recover in a temporary file, and no -wal file left behind
+            cursor.execute("PRAGMA journal_mode=OFF;")
+            cursor.execute("PRAGMA synchronous=OFF;")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                src text primary key,
+                tag text
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS image_pages (
+                src text,
+                page text
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS image_pages_src ON image_pages (src);")
+        self.connection.commit()
+        cursor.close()
+
+    def reset(self):
+        """
+        Forget images of a previous crawl
+        """
+        for table in ('images', 'image_pages'):
+            self.connection.execute("delete from {};".format(table))
+        self.connection.commit()
+
+    def flush(self):
+        """
+        Commit pending writes
+        """
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+        if self.file is not None:
+            self.file.close()
+
+    def commit(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.connection.commit()
+            self.pending = 0
+
+    def add(self, page_url, tag):
+        src = normalize_src(tag[self.field])
+        self.connection.execute("""insert into image_pages values (?, ?);""", (src, page_url))
+        cursor = self.connection.execute("""insert or ignore into images values (?, ?);""", (src, json.dumps(tag)))
+        self.commit()
+        return cursor.rowcount == 1
+
+    def get(self, src):
+        row = self.connection.execute("""select tag from images where src = ?;""", (normalize_src(src),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def pages_of(self, src):
+        rows = self.connection.execute("""select page from image_pages where src = ?;""", (normalize_src(src),))
+        return [row[0] for row in rows]
+
+    def __contains__(self, src):
+        return self.connection.execute(
+            """select 1 from images where src = ?;""", (normalize_src(src),)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute("""select count(*) from images;""").fetchone()[0]
+
+    def __iter__(self):
+        for row in self.connection.execute("""select tag from images;""").fetchall():
+            yield json.loads(row[0])
@@ -0,0 +1,157 @@
+import json
+import logging
+import sqlite3
+
+from pysitemap.backends.done import DoneRecord
+
+
+class SQLiteState(object):
+    """
+    Crash-safe crawl state: frontier, done records and image check results.
+
+    The pages table keeps validators (ETag, Last-Modified) and extracted
+    links and images of every page for conditional requests. It survives
+    reset(), so the next crawl can reuse what did not change.
+
+    The database runs in WAL mode and writes are committed in batches of
+    batch_size statements, or by checkpoint(). A crawl interrupted by a
+    crash or SIGINT is resumed from the last commit.
+    """
+
+    def __init__(self, db_name, batch_size=1000):
+        """
+        :param db_name: path to the database file
+        :type db_name: str
+        :param batch_size: count of writes per commit
+        :type batch_size: int
+        """
+        self.connection = sqlite3.connect(db_name)
+        self.batch_size = batch_size
+        self.pending = 0
+        self.__init_tables()
+
+    def __init_tables(self):
+        cursor = self.connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute("PRAGMA synchronous=NORMAL;")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key text primary key,
+                value text
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                url text primary key
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS done (
+                url text primary key,
+                ok integer,
+                lastmod text,
+                changefreq text,
+                priority text,
+                images text
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                src text primary key,
+                ok integer
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url text primary key,
+                etag text,
+                last_modified text,
+                links text,
+                images text
+            );
+        """)
+        self.connection.commit()
+        cursor.close()
+
+    def execute(self, sql, params=()):
+        try:
+            self.connection.execute(sql, params)
+        except Exception as e:
+            logging.info(e)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def checkpoint(self):
+        """
+        Commit pending writes and move the WAL into the database file
+        """
+        self.commit()
+        self.connection.execute("PRAGMA wal_checkpoint(PASSIVE);")
+
+    def close(self):
+        self.checkpoint()
+        self.connection.close()
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("""select value from meta where key = ?;""", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.connection.execute("""insert or replace into meta values (?, ?);""", (key, value))
+        self.commit()
+
+    def reset(self):
+        """
+        Forget frontier, done records and images of a previous crawl
+        """
+        for table in ('frontier', 'done', 'images'):
+            self.connection.execute("delete from {};".format(table))
+        self.commit()
+
+    def add_todo(self, url):
+        self.execute("""insert or ignore into frontier values (?);""", (url,))
+
+    def set_done(self, url, record):
+        self.execute("""insert or replace into done values (?, ?, ?, ?, ?, ?);""", (url,) + record.to_row())
+        self.execute("""delete from frontier where url = ?;""", (url,))
+
+    def set_image(self, src, ok):
+        self.execute("""insert or replace into images values (?, ?);""", (src, ok))
+
+    def set_page(self, url, etag, last_modified, links, images):
+        """
+        Remember validators and extracted data of a fetched page
+        """
+        self.execute("""insert or replace into pages values (?, ?, ?, ?, ?);""",
+                     (url, etag, last_modified, json.dumps(links), json.dumps(images)))
+
+    def delete_page(self, url):
+        self.execute("""delete from pages where url = ?;""", (url,))
+
+    def get_page(self, url):
+        """
+        :return: (etag, last_modified, links, images) of a page fetched before, or None
+        """
+        row = self.connection.execute(
+            """select etag, last_modified, links, images from pages where url = ?;""", (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3])
+
+    def frontier(self):
+        for row in self.connection.execute("""select url from frontier;""").fetchall():
+            yield row[0]
+
+    def done_items(self):
+        cursor = self.connection.execute("""select url, ok, lastmod, changefreq, priority, images from done;""")
+        for row in cursor:
+            yield row[0], DoneRecord.from_row(*row[1:])
+
+    def images(self):
+        for src, ok in self.connection.execute("""select src, ok from images;""").fetchall():
+            yield src, bool(ok)
@@ -3,21 +3,46 @@ import sqlite3
 
 
 class SQLiteTodo(object):
-    def __init__(self, db_name):
+    def __init__(self, db_name, reset=True, batch_size=1000):
+        """
+        :param db_name: path to the database file
+        :param reset: drop urls left by a previous run?
+        :param batch_size: count of writes per commit
+        """
         self.connection = sqlite3.connect(db_name)
-        self.__init_tables()
+        self.batch_size = batch_size
+        self.pending = 0
+        self.__init_tables(reset)
 
-    def __init_tables(self):
+    def __init_tables(self, reset):
         cursor = self.connection.cursor()
-        cursor.execute("DROP TABLE IF EXISTS todo_queue;")
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        if reset:
+            cursor.execute("DROP TABLE IF EXISTS todo_queue;")
         cursor.execute("""
-            CREATE TABLE todo_queue (
+            CREATE TABLE IF NOT EXISTS todo_queue (
                 url text(1000) primary key
             );
         """)
         self.connection.commit()
         cursor.close()
 
+    def commit(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Commit pending writes
+        """
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
     def add(self, url):
         cursor = self.connection.cursor()
         try:
@@ -25,7 +50,7 @@ class SQLiteTodo(object):
         except Exception as e:
             logging.info(e)
         finally:
-            self.connection.commit()
+            self.commit()
             cursor.close()
 
     def remove(self, url):
@@ -35,7 +60,7 @@ class SQLiteTodo(object):
         except Exception as e:
             logging.info(e)
         finally:
-            self.connection.commit()
+            self.commit()
             cursor.close()
 
     def __contains__(self, item):
@@ -43,9 +68,7 @@ class SQLiteTodo(object):
         result = False
         try:
             cursor.execute("""select 1 from todo_queue where url = ?""", (item, ))
-            row = cursor.fetchone()
-            if len(row):
-                result = True
+            result = cursor.fetchone() is not None
         except Exception as e:
             logging.info(e)
         finally:
@@ -1,30 +1,54 @@
 import logging
 import asyncio
+import os
 import re
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pysitemap.rules import PatternSet, FirstMatchTable
+from pysitemap.parsers import LinkParser, SitemapParser, feed_stream, read_sitemap, parse_document, \
+    IMAGE_FIELDS, CHUNK_SIZE
+from pysitemap.fetcher import Fetcher
+from pysitemap.metrics import Metrics, progress_line, render, serve
+from pysitemap.robots import RobotsCache
+from pysitemap.backends.sqlite_state import SQLiteState
+from pysitemap.backends.done import DoneRecord, DoneStore
+from pysitemap.backends.images import ImageRegistry
 from pysitemap.format_processors.xml import XMLWriter
 from pysitemap.format_processors.text import TextWriter
-import aiohttp
+from pysitemap.format_processors.compressed import GzipMixin, XMLGzipWriter, TextGzipWriter
 
 
 class Crawler:
 
     format_processors = {
         'xml': XMLWriter,
-        'txt': TextWriter
+        'txt': TextWriter,
+        'xml.gz': XMLGzipWriter,
+        'txt.gz': TextGzipWriter
     }
 
+    # HEAD responses meaning the server does not support HEAD requests
+    head_rejected = (400, 403, 405, 501)
+
     def __init__(self, rooturl, out_file, out_format='xml', maxtasks=10, exclude_urls=[], exclude_imgs=[],
                  image_root_urls=[], use_lastmodified=True, verifyssl=True, findimages=True, images_this_domain=True,
                  headers=None, timezone_offset=0, changefreq=None, priorities=None, todo_queue_backend=set,
-                 done_backend=dict, done_images=list):
+                 done_backend=DoneStore, done_images=ImageRegistry, max_body_size=10 * 1024 * 1024,
+                 image_tags=None, image_probe='head', limit_per_host=0, request_timeout=30, delay=0,
+                 adaptive_concurrency=True, state_file=None, checkpoint_interval=30, seen_backend=set,
+                 stream_output=False, output_queue_size=1000, sitemap_max_urls=50000,
+                 sitemap_max_bytes=50 * 1024 * 1024, sitemap_base_url=None, compresslevel=6,
+                 incremental=False, merge_existing=False, seed_sitemaps=False, use_robots=False,
+                 parse_executor=None, parse_workers=None, parse_threshold=256 * 1024, fetcher=None,
+                 verbose=True, progress_interval=10, metrics_port=None):
         """
         Crawler constructor
         :param rooturl: root url of site
         :type rooturl: str
         :param out_file: file to save sitemap result
         :type out_file: str
-        :param out_format: sitemap type [xml | txt]. Default xml
+        :param out_format: sitemap type [xml | txt | xml.gz | txt.gz]. Default xml
         :type out_format: str
         :param maxtasks: maximum count of tasks. Default 10
         :type maxtasks: int
@@ -48,6 +72,78 @@ class Crawler:
         :type changefreq: dict
         :param priorities: dictionary, where key is site sub url regex, and value is priority float
         :type priorities: dict
+        :param done_backend: mapping class of processed urls. Default backends.done.DoneStore
+        :type done_backend: type
+        :param done_images: registry class of found images, called without arguments, e.g.
+            backends.images.SQLiteImageRegistry (temporary file) or functools.partial(SQLiteImageRegistry, path)
+            (kept after the crawl, cleared when the next one starts). Default backends.images.ImageRegistry
+        :type done_images: type
+        :param max_body_size: read at most this many bytes of a page, None for no limit. Default 10 MiB
+        :type max_body_size: int
+        :param image_tags: dictionary, where key is tag name and value is list of image fields to collect.
+            Default {'img': ['src', 'title', 'caption', 'geo_location', 'license']}
+        :type image_tags: dict
+        :param image_probe: how image mimetypes are checked [head | get]. 'head' sends HEAD and falls back
+            to a one byte range GET, 'get' downloads the image. Default head
+        :type image_probe: str
+        :param limit_per_host: maximum count of connections per host, 0 for no limit
+        :type limit_per_host: int
+        :param request_timeout: total seconds per request. Default 30
+        :type request_timeout: float
+        :param delay: minimum seconds between two requests to the same host
+        :type delay: float
+        :param adaptive_concurrency: lower concurrency automatically on slow responses, errors and 429/503?
+        :type adaptive_concurrency: bool
+        :param state_file: SQLite file keeping crawl state; an interrupted crawl is resumed from it
+        :type state_file: str
+        :param checkpoint_interval: seconds between commits of crawl state. Default 30
+        :type checkpoint_interval: float
+        :param seen_backend: set-like class of urls already queued, e.g. backends.fingerprint.FingerprintSet
+            for memory-bounded crawls of huge sites. Default set
+        :type seen_backend: type
+        :param stream_output: write entries while the crawl runs instead of at the end
+        :type stream_output: bool
+        :param output_queue_size: entries waiting for the streaming writer before processing blocks
+        :type output_queue_size: int
+        :param sitemap_max_urls: maximum count of urls per sitemap file, more are split into shards
+            referenced by a sitemap index. Default 50000
+        :type sitemap_max_urls: int
+        :param sitemap_max_bytes: maximum size of sitemap file. Default 50 MiB
+        :type sitemap_max_bytes: int
+        :param sitemap_base_url: url the sitemap files are published under. Default rooturl
+        :type sitemap_base_url: str
+        :param compresslevel: gzip compression level of xml.gz and txt.gz output, 1-9. Default 6
+        :type compresslevel: int
+        :param incremental: send If-None-Match/If-Modified-Since with validators of the previous crawl, and reuse
+            its links, images and lastmod of pages answered with 304 Not Modified. Requires state_file
+        :type incremental: bool
+        :param merge_existing: update the sitemap already at out_file instead of replacing it: entries of crawled
+            urls are replaced, urls which failed (errors, status >= 400) are dropped and all others are kept
+        :type merge_existing: bool
+        :param seed_sitemaps: queue the urls of sitemaps listed in robots.txt before following links. True, or a
+            list of further sitemap or sitemap index urls to read. Default False
+        :type seed_sitemaps: bool or list
+        :param use_robots: skip urls disallowed by robots.txt for the User-Agent of headers, and wait Crawl-delay
+            seconds between requests. Default False
+        :type use_robots: bool
+        :param parse_executor: parse pages in a pool off the event loop: 'thread', 'process' or an Executor
+            instance. Pages are then read whole before they are parsed. Default None, parse while reading
+        :type parse_executor: str or concurrent.futures.Executor
+        :param parse_workers: worker count of a 'thread' or 'process' pool. Default count of CPUs
+        :type parse_workers: int
+        :param parse_threshold: pages smaller than this many bytes are parsed on the event loop. Default 256 KiB
+        :type parse_threshold: int
+        :param fetcher: Fetcher shared with other crawlers, opened and closed by its owner. Default a Fetcher
+            of this crawler from the request options above
+        :type fetcher: pysitemap.fetcher.Fetcher
+        :param verbose: print every url when it is processed. Default True
+        :type verbose: bool
+        :param progress_interval: seconds between progress lines with counts and phase timings, None for none.
+            Default 10
+        :type progress_interval: float
+        :param metrics_port: serve the crawl metrics in Prometheus text format at
+            http://127.0.0.1:metrics_port/metrics while the crawl runs. Default None
+        :type metrics_port: int
         """
         self.rooturl = rooturl
         self.exclude_urls = exclude_urls
@@ -57,165 +153,485 @@ class Crawler:
         self.findimages = findimages
         self.images_this_domain = images_this_domain
         self.todo_queue = todo_queue_backend()
+        # every url ever queued, the only structure checked for duplicates
+        self.seen = seen_backend()
         self.busy = set()
         self.done = done_backend()
         self.done_images = done_images()
+        # crawl-wide cache of image mimetype checks: url -> bool
+        self.checked_mimes = {}
+        self.pending_mimes = {}
+        self.mime_timeout = 20
+        self.image_probe = image_probe
+        self.probe_bytes_saved = 0
         self.tasks = set()
-        self.sem = asyncio.Semaphore(maxtasks)
+        self.maxtasks = maxtasks
+        # frontier of urls waiting for a worker
+        self.queue = asyncio.Queue()
         self.timezone_offset = timezone_offset
         self.changefreq = changefreq
         self.priorities = priorities
-
-        # connector stores cookies between requests and uses connection pool
-        self.session = aiohttp.ClientSession(
-            headers=headers,
-            connector=aiohttp.TCPConnector(verify_ssl=verifyssl)
-        )
-        self.writer = self.format_processors.get(out_format)(out_file)
+        # url rules are compiled once and shared by all workers
+        self.exclude_url_rules = PatternSet(exclude_urls)
+        self.exclude_img_rules = PatternSet(exclude_imgs)
+        self.changefreq_rules = FirstMatchTable(changefreq)
+        self.priority_rules = FirstMatchTable(priorities)
+        self.max_body_size = max_body_size
+        self.image_tags = image_tags or {'img': IMAGE_FIELDS}
+        self.metrics = Metrics()
+        self.metrics.gauge('queue_depth', self.queue.qsize)
+        self.metrics.gauge('pages_in_flight', lambda: len(self.busy))
+        self.metrics.gauge('done_urls', lambda: len(self.done))
+        self.own_fetcher = fetcher is None
+        self.fetcher = fetcher or Fetcher(maxtasks=maxtasks, limit_per_host=limit_per_host, headers=headers,
+                                          verifyssl=verifyssl, timeout=request_timeout, delay=delay,
+                                          adaptive=adaptive_concurrency, metrics=self.metrics)
+        writer_class = self.format_processors.get(out_format)
+        if writer_class is None:
+            raise ValueError('unknown out_format {!r}, one of {}'.format(
+                out_format, ', '.join(self.format_processors)))
+        writer_options = dict(max_urls=sitemap_max_urls, max_bytes=sitemap_max_bytes,
+                              base_url=sitemap_base_url or rooturl)
+        if issubclass(writer_class, GzipMixin):
+            writer_options['compresslevel'] = compresslevel
+        self.writer = writer_class(out_file, **writer_options)
+        self.state = SQLiteState(state_file) if state_file else None
+        self.stream_output = stream_output
+        self.output_queue_size = output_queue_size
+        self.output = None
+        self.checkpoint_interval = checkpoint_interval
+        self.incremental = incremental and self.state is not None
+        self.not_modified = 0
+        self.merge_existing = merge_existing
+        self.seed_sitemaps = seed_sitemaps
+        self.robots = RobotsCache(self.fetcher)
+        self.use_robots = use_robots
+        self.robots_user_agent = (headers or {}).get('User-Agent', '*')
+        self.robots_rules = None
+        self.parse_executor = parse_executor
+        self.parse_workers = parse_workers
+        self.parse_threshold = parse_threshold
+        self.executor = None
+        self.stopping = None
+        self.verbose = verbose
+        self.progress_interval = progress_interval
+        self.metrics_port = metrics_port
+        self.started = None
+        # set when the frontier was drained, i.e. the output is complete
+        self.completed = False
 
     async def run(self):
         """
         Main function to start parsing site
         :return:
         """
-        t = asyncio.ensure_future(self.addurls([(self.rooturl, '')]))
-        await asyncio.sleep(1)
-        while self.busy:
-            await asyncio.sleep(1)
+        if self.own_fetcher:
+            await self.fetcher.open()
+        self.stopping = asyncio.Event()
+        self.started = time.monotonic()
+        if self.parse_executor == 'thread':
+            self.executor = ThreadPoolExecutor(self.parse_workers)
+        elif self.parse_executor == 'process':
+            self.executor = ProcessPoolExecutor(self.parse_workers)
+        else:
+            self.executor = self.parse_executor
+        writer_task = None
+        if self.state is not None:
+            self.resume()
+        if self.use_robots:
+            await self.loadrobots()
+        if self.stream_output:
+            self.output = asyncio.Queue(self.output_queue_size)
+            await self.writer.open(self.timezone_offset)
+            # Entries of a resumed crawl go first
+            for url, record in self.done.items():
+                await self.writer.add(url, record)
+            writer_task = asyncio.ensure_future(self.writeloop())
+        await self.addurls([(self.rooturl, '')])
+
+        # Fixed pool of workers serves the frontier until it is drained
+        for _ in range(self.maxtasks):
+            task = asyncio.ensure_future(self.work())
+            task.add_done_callback(self.tasks.discard)
+            self.tasks.add(task)
+
+        drain = asyncio.ensure_future(self.drain())
+        waiters = [drain, asyncio.ensure_future(self.stopping.wait())]
+        if self.state is not None:
+            waiters.append(asyncio.ensure_future(self.checkpoint()))
+        if self.progress_interval:
+            waiters.append(asyncio.ensure_future(self.report()))
+        if writer_task is not None:
+            # A failed writer would leave the workers blocked on the full output queue
+            waiters.append(writer_task)
+        metrics_server = None
+        done = set()
+        try:
+            if self.metrics_port is not None:
+                metrics_server = await serve(self.render_metrics, self.metrics_port)
+            done, _pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            # Checkpoints, reports and the streaming writer run until the
+            # crawl ends, they only finish early by failing
+            self.completed = drain in done and not any(
+                not task.cancelled() and task.exception() is not None for task in done)
+        finally:
+            # Image probes go too, before their session is closed
+            tasks = [task for task in waiters if task is not writer_task]
+            tasks += list(self.tasks) + list(self.pending_mimes.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.own_fetcher:
+                await self.fetcher.close()
+            if self.executor is not None and self.executor is not self.parse_executor:
+                self.executor.shutdown()
+            self.done_images.flush()
+            # Frontier backends kept on disk (SQLiteTodo) commit in batches
+            flush_todo = getattr(self.todo_queue, 'flush', None)
+            if flush_todo is not None:
+                flush_todo()
+            if self.state is not None:
+                self.state.checkpoint()
+            if writer_task is not None and not writer_task.done():
+                await self.output.put(None)
+                await writer_task
+            if metrics_server is not None:
+                await metrics_server.cleanup()
 
-        await t
-        await self.session.close()
-        await self.writer.write([(key, value) for key, value in self.done.items() if key and value], self.timezone_offset)
+        try:
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            if self.completed:
+                await self.save()
+            else:
+                print('crawl stopped', '' if self.state is None else '- run again to resume it')
+            if self.progress_interval:
+                print('progress:', self.progress())
+        finally:
+            if self.state is not None:
+                self.state.close()
+
+    async def save(self):
+        """
+        Write results of the completed crawl
+        """
+        if self.output is None:
+            with self.metrics.timer('write'):
+                await self.writer.write(self.output_entries(), self.timezone_offset)
+        if self.state is not None:
+            self.state.set_meta('status', 'finished')
 
-    async def contains(self, url, regex, rlist=True):
+    async def loadrobots(self):
         """
-        Does url path matches a value in regex_list?
+        Compile robots.txt rules of the site, and slow down requests to its
+        Crawl-delay
         """
-        retvalue = False
-        if rlist:
-            for exc in regex:
-                retvalue = bool(re.search(re.compile(r"{}".format(exc)), url))
-                if retvalue: return retvalue
-        else:
-            retvalue = bool(re.search(re.compile(r"{}".format(regex)), url))
-        return retvalue
+        self.robots_rules = await self.robots.rules(self.rooturl, self.robots_user_agent)
+        if self.robots_rules.delay:
+            host = urllib.parse.urlsplit(self.rooturl).netloc
+            self.fetcher.host_delays[host] = max(self.fetcher.delay, self.robots_rules.delay)
+            print('robots.txt crawl delay:', self.fetcher.host_delays[host], 'seconds')
+
+    async def drain(self):
+        """
+        Wait until the frontier is seeded and drained
+        """
+        if self.seed_sitemaps:
+            await self.seed()
+        await self.queue.join()
+
+    async def seed(self):
+        """
+        Queue urls of the sitemaps listed in robots.txt and of seed_sitemaps.
+        Sitemaps are parsed while they download, urls are queued chunk by chunk
+        """
+        sitemaps = [] if self.seed_sitemaps is True else list(self.seed_sitemaps)
+        sitemaps += await self.robots.sitemaps(self.rooturl)
+        visited = set()
+        seeded = 0
+        while sitemaps:
+            sitemap = sitemaps.pop()
+            if sitemap in visited:
+                continue
+            visited.add(sitemap)
+            print('seeding from:', sitemap)
+            parser = SitemapParser()
+            try:
+                async with self.fetcher.request('GET', sitemap) as resp:
+                    if resp.status != 200:
+                        print('...', sitemap, 'has status', resp.status)
+                        continue
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        parser.feed(chunk)
+                        seeded += await self.addseeds(parser, sitemaps)
+                parser.close()
+            except Exception as exc:
+                print('...', sitemap, 'has error', repr(str(exc)))
+            seeded += await self.addseeds(parser, sitemaps)
+        print('seeded', seeded, 'urls from', len(visited), 'sitemaps')
+
+    async def addseeds(self, parser, sitemaps):
+        """
+        Queue urls collected by a SitemapParser, add sitemaps of an index to sitemaps
+        :return: count of urls queued
+        """
+        sitemaps.extend(parser.pop_sitemaps())
+        seen = len(self.seen)
+        await self.addurls([(url, '') for url, _record in parser.pop_urls()])
+        return len(self.seen) - seen
 
-    async def urldict(self, url, url_dict):
+    def stop(self):
+        """
+        Stop crawling, e.g. on SIGINT. Urls being processed stay in the
+        frontier of the crawl state and are fetched again on resume
+        """
+        if self.stopping is not None:
+            self.stopping.set()
+
+    def resume(self):
+        """
+        Load crawl state left by an interrupted crawl of the same site,
+        or clear it to start a new crawl
+        """
+        if (self.state.get_meta('status') != 'running' or
+                self.state.get_meta('rooturl') != self.rooturl):
+            self.state.reset()
+            self.state.set_meta('rooturl', self.rooturl)
+            self.state.set_meta('status', 'running')
+            return
+
+        for url, record in self.state.done_items():
+            self.done[url] = record
+            self.seen.add(url)
+            for image in record.images:
+                self.done_images.add(url, image)
+        for src, ok in self.state.images():
+            self.checked_mimes[src] = ok
+        for url in self.state.frontier():
+            self.seen.add(url)
+            self.todo_queue.add(url)
+            self.queue.put_nowait(url)
+        print('resuming:', len(self.done), 'done,', len(self.todo_queue), 'in queue')
+
+    def metric_sources(self):
+        """
+        Metrics of the crawl: its own, and those of a shared fetcher
+        """
+        sources = [self.metrics]
+        if self.fetcher.metrics is not None and self.fetcher.metrics is not self.metrics:
+            sources.append(self.fetcher.metrics)
+        return sources
+
+    def progress(self):
+        return progress_line(self.metric_sources(), time.monotonic() - self.started)
+
+    def render_metrics(self):
+        return render([({}, metrics) for metrics in self.metric_sources()])
+
+    async def report(self):
+        """
+        Periodically print a progress line
+        """
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            print('progress:', self.progress())
+
+    async def checkpoint(self):
+        """
+        Periodically commit crawl state
+        """
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.state.checkpoint()
+
+    async def markdone(self, url, record):
+        """
+        Store result of processed url, and pass it to the writer when
+        output is streamed
+        """
+        self.done[url] = record
+        if self.state is not None:
+            self.state.set_done(url, record)
+        if self.output is not None:
+            await self.output.put((url, record))
+
+    async def writeloop(self):
+        """
+        Background writer of streamed output. A None entry ends the crawl,
+        the output file is completed only if the crawl completed
+        """
+        while True:
+            entry = await self.output.get()
+            if entry is None:
+                break
+            if entry[1].ok or not self.merge_existing:
+                with self.metrics.timer('write'):
+                    await self.writer.add(*entry)
+        if self.merge_existing and self.completed:
+            for url, record in self.existing_entries():
+                await self.writer.add(url, record)
+        await self.writer.close(complete=self.completed)
+        if not self.completed:
+            print('partial output left in', ', '.join(self.writer.tmp_filenames))
+
+    def output_entries(self):
         """
-        Parse URL regex (key) and value pairs
+        Entries of the sitemap written at the end of the crawl
         """
-        for urlkey, regvalue in url_dict.items():
-            if await self.contains(url, urlkey, rlist=False):
-                return regvalue
-        return None
+        for url, record in self.done.items():
+            if url and (record.ok or not self.merge_existing):
+                yield url, record
+        if self.merge_existing:
+            yield from self.existing_entries()
+
+    def existing_entries(self):
+        """
+        Entries of the sitemap already at out_file for urls which were not crawled
+        """
+        filenames = [name for name in (self.writer.filename, self.writer.index_filename) if os.path.exists(name)]
+        if not filenames:
+            return
+        # Of a plain and a sharded sitemap, the one written last is current
+        filename = max(filenames, key=os.path.getmtime)
+        print('merging entries of', filename)
+        for url, record in read_sitemap(filename):
+            if url not in self.done:
+                yield url, record
+
+    async def work(self):
+        """
+        Worker loop: take urls from the frontier and process them
+        :return:
+        """
+        while True:
+            url = await self.queue.get()
+            try:
+                await self.process(url)
+            except Exception as exc:
+                print('...', url, 'has error', repr(str(exc)))
+                await self.markdone(url, DoneRecord(False))
+                self.busy.discard(url)
+            finally:
+                self.queue.task_done()
 
     async def addurls(self, urls):
         """
-        Add urls in queue and run process to parse
+        Add urls in queue; workers started by run() pick them up
         :param urls:
         :return:
         """
-        for url, parenturl in urls:
-            url = urllib.parse.urljoin(parenturl, url)
-            url, frag = urllib.parse.urldefrag(url)
-
-            if (url.startswith(self.rooturl) and
-                    not await self.contains(url, self.exclude_urls, rlist=True) and
-                    url not in self.busy and
-                    url not in self.done and
-                    url not in self.todo_queue):
-                self.todo_queue.add(url)
-                # Acquire semaphore
-                await self.sem.acquire()
-                # Create async task
-                task = asyncio.ensure_future(self.process(url))
-                # Add collback into task to release semaphore
-                task.add_done_callback(lambda t: self.sem.release())
-                # Callback to remove task from tasks
-                task.add_done_callback(self.tasks.remove)
-                # Add task into tasks
-                self.tasks.add(task)
+        with self.metrics.timer('rules'):
+            for url, parenturl in urls:
+                url = urllib.parse.urljoin(parenturl, url)
+                url, frag = urllib.parse.urldefrag(url)
+
+                if (url.startswith(self.rooturl) and
+                        url not in self.seen and
+                        (self.robots_rules is None or self.robots_rules.allowed(url)) and
+                        url not in self.exclude_url_rules):
+                    self.seen.add(url)
+                    self.todo_queue.add(url)
+                    self.queue.put_nowait(url)
+                    if self.state is not None:
+                        self.state.add_todo(url)
 
     async def mimechecker(self, url, expected):
         """
-        Check url resource mimetype
+        Check url resource mimetype.
+        In 'head' probe mode only headers are requested: HEAD first, and a
+        single byte range GET if the server rejects HEAD.
         """
+        if self.image_probe == 'head':
+            probes = (('HEAD', None), ('GET', {'Range': 'bytes=0-0'}))
+        else:
+            probes = (('GET', None),)
 
-        self.todo_queue.remove(url)
-        self.busy.add(url)
+        for method, headers in probes:
+            try:
+                async with self.fetcher.request(method, url, headers=headers) as resp:
+                    if method == 'HEAD' and resp.status in self.head_rejected:
+                        continue
+                    mime = resp.headers.get('content-type', '')
+                    ok = resp.status in (200, 206) and bool(re.search(expected, mime))
+                    if ok:
+                        self.probe_bytes_saved += self.bodysize(resp)
+                    return ok
+            except Exception as exc:
+                return False
+        return False
 
+    @staticmethod
+    def bodysize(resp):
+        """
+        Size of the resource body we did not download, known from the
+        Content-Length of a HEAD or the Content-Range of a partial GET
+        """
         try:
-            resp = await self.session.get(url)
-        except Exception as exc:
+            if resp.status == 206:
+                return max(int(resp.headers.get('content-range', '').rsplit('/', 1)[1]) - 1, 0)
+            if resp.method == 'HEAD':
+                return int(resp.headers.get('content-length', 0))
+        except (IndexError, ValueError):
             pass
-        else:
-            mime = resp.headers.get('content-type')
-            if (resp.status == 200 and
-                bool(re.search(re.compile(r'{}'.format(expected)), mime))):
-                resp.close()
-                self.busy.remove(url)
-                return True
-        resp.close()
-        self.busy.remove(url)
-        return False
+        return 0
 
-    async def fetchtags(self, data, url, tag_input, fields=[]):
+    async def checkmime(self, url, expected):
         """
-        Find and sort all target tags from website data
+        Cached mimechecker: every url is probed once per crawl, results
+        (also negative ones) are kept in self.checked_mimes
         """
-        tags = []
-        lines_join = []
-        for line in data.split('\n'):
-            lines_join.append(line)
-
-        tags_raw = re.findall(re.compile(r'<{}.*?>'.format(tag_input)), ' '.join(lines_join))
+        if url in self.checked_mimes:
+            return self.checked_mimes[url]
 
-        for tag_raw in tags_raw:
-            tag_raw = re.sub(re.compile(r'<{}(.*?)>'.format(tag_input)), '\\1', tag_raw)
+        task = self.pending_mimes.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._checkmime(url, expected))
+            self.pending_mimes[url] = task
+        # Several pages may wait for the same probe, do not let one of them cancel it
+        return await asyncio.shield(task)
 
-            # Regex lookahead + lookbehind
-            # Find patterns, where pattern start with "<word>=" and ends with " <word>="
-            # Include the first pattern, which will be used to determine
-            # value which the pattern holds in it
-
-            # TODO Note: this method is error-prone, since it assumes that...
-            #  ... no argument value inside <img ... /> tag has value of "<somechar>="
-            #  If this happens, args regex findall & splitting (below) fails.
-            args_raw = re.findall(r'(?i)(?=[\w]+[=]|[\w\"\'])(.*?)(?=\s[\w]+[=])', tag_raw)
-            tag = []
-            for arg_raw in args_raw:
-                arg = arg_raw.split('=')
-                if len(arg) != 2:
-                    print("warning: failure on tag data parsing operation.")
-                    continue
+    async def _checkmime(self, url, expected):
+        try:
+            result = await asyncio.wait_for(self.mimechecker(url, expected), timeout=self.mime_timeout)
+        except asyncio.TimeoutError:
+            print("couldn't add tag data:", url)
+            result = False
+        finally:
+            # also when the probe is cancelled, it is not recorded then
+            del self.pending_mimes[url]
+        if self.fetcher.session is None or self.fetcher.session.closed:
+            # The probe failed because the crawl ended, the image was not checked
+            return False
+        self.checked_mimes[url] = result
+        if self.state is not None:
+            self.state.set_image(url, result)
+        return result
 
-                arg_dict = {}
-                key = arg[0]
-                # Remove leading and trailing quote marks from value
-                value = re.sub(r'^["\']?(.*?)["\']?$', '\\1', arg[1])
-                value = re.sub(r'&', '&amp;', value)
-                for field in fields:
-                    if key == field:
-                        arg_dict[field] = value
-#                    else:
-#                        print("warning: ignoring tag data value:", key)
-
-                if len(arg_dict) == 1:
-                    tags.append(arg_dict)
-        return tags
+    async def fetchtags(self, data, url, tag_input, fields=[]):
+        """
+        Find all target tags from website data
+        :return: list of dictionaries with wanted fields of each tag
+        """
+        parser = LinkParser(tag_fields={tag_input: fields})
+        parser.feed(data)
+        parser.close()
+        return parser.pop_tags()
 
     async def addtagdata(self, tagdata, url, source_url_field,
-                            mimetype, tag_root_urls=[], excludes=[],
-                            done_list=[], this_domain=True):
+                            mimetype, tag_root_urls=[], excludes=None,
+                            done_list=None, this_domain=True):
         """
         Validate existence of url in given tagdata
         :return: dictionary of validated tags (of single type)
         """
-        tags = []
+        if done_list is None:
+            done_list = self.done_images
+        candidates = {}
         for tag in tagdata:
             if not source_url_field in tag:
                 continue
-            if not await self.contains(tag[source_url_field], excludes, rlist=True):
+            if not excludes or tag[source_url_field] not in excludes:
 
                 if this_domain:
                     if not tag[source_url_field].startswith('http'):
@@ -227,41 +643,59 @@ class Crawler:
                     if not tag[source_url_field].startswith('http'):
                         continue
 
-                if (tag[source_url_field].startswith('http') and
-                    tag not in done_list and
-                    tag[source_url_field] not in self.busy and
-                    tag[source_url_field] not in self.todo_queue):
-                    self.todo_queue.add(tag[source_url_field])
-                    # Acquire semaphore
-                    await self.sem.acquire()
-                    # Create async task
-                    task = asyncio.ensure_future(self.mimechecker(tag[source_url_field], mimetype))
-                    # Add collback into task to release semaphore
-                    task.add_done_callback(lambda t: self.sem.release())
-                    # Callback to remove task from tasks
-                    task.add_done_callback(self.tasks.remove)
-                    # Add task into tasks
-                    self.tasks.add(task)
-                    try:
-                        result = await asyncio.wait_for(task, timeout=20)
-                        if (result):
-                            tags.append(tag)
-
-                    except asyncio.TimeoutError:
-                        print("couldn't add tag data:", tag[source_url_field])
-                        task.cancel()
-                        pass
-
-        done_list.extend(tags)
+                src = tag[source_url_field]
+                if not src.startswith('http') or src in candidates:
+                    continue
+                if src in done_list:
+                    # Listed on an earlier page already, only note this page too
+                    done_list.add(url, tag)
+                    continue
+                candidates[src] = tag
+
+        # All images of the page are validated concurrently, limited by the fetcher
+        results = await asyncio.gather(*(self.checkmime(src, mimetype) for src in candidates))
+        # add() tells whether the image is new, another page may have
+        # registered it while we were waiting
+        tags = [tag for tag, result in zip(candidates.values(), results) if result and done_list.add(url, tag)]
+
         return tags
 
+    async def readbody(self, resp):
+        """
+        Read response body, at most max_body_size bytes
+        """
+        chunks = []
+        size = 0
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            if self.max_body_size is not None and size + len(chunk) > self.max_body_size:
+                chunk = chunk[:self.max_body_size - size]
+            chunks.append(chunk)
+            size += len(chunk)
+            if self.max_body_size is not None and size >= self.max_body_size:
+                break
+        return b''.join(chunks)
+
+    async def parsebody(self, body):
+        """
+        Extract hrefs and image tags of a page, in the parse executor
+        unless the page is small
+        :return: (list of href values, list of tag attribute dictionaries)
+        """
+        tag_fields = self.image_tags if self.findimages else None
+        with self.metrics.timer('parse'):
+            if len(body) < self.parse_threshold:
+                return parse_document(body, tag_fields)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, parse_document, body, tag_fields)
+
     async def process(self, url):
         """
         Process single url
         :param url:
         :return:
         """
-        print('processing:', url)
+        if self.verbose:
+            print('processing:', url)
 
         # remove url from basic queue and add it into busy list
         self.todo_queue.remove(url)
@@ -271,51 +705,99 @@ class Crawler:
         cf = None
         pr = None
         imgs = []
+        links = []
+        img_data = []
+        body = None
+        headers = {}
+
+        # Page data of the previous crawl, reused if the page did not change
+        cached = self.state.get_page(url) if self.incremental else None
+        if cached is not None:
+            etag, last_modified = cached[:2]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
 
         try:
-            resp = await self.session.get(url)  # await response
+            # the response is released (and its connection reused when the body
+            # was read to the end) when the block exits
+            async with self.fetcher.request('GET', url, headers=headers or None) as resp:
+                status = resp.status
+                not_modified = resp.status == 304 and cached is not None
+                # only url with status == 200 and content type == 'text/html' parsed
+                parse = resp.status == 200 and 'text/html' in resp.headers.get('content-type', '')
+                if not_modified:
+                    self.not_modified += 1
+                    etag, last_modified, links, img_data = cached
+                    await self.addurls([(u, url) for u in links])
+                    if self.use_lastmodified:
+                        lastmod = last_modified
+                elif parse and self.executor is not None:
+                    body = await self.readbody(resp)
+                elif parse:
+                    # Links are queued while the rest of the page is still downloading
+                    parser = LinkParser(tag_fields=self.image_tags if self.findimages else None)
+                    async for _text in feed_stream(parser, resp.content, max_size=self.max_body_size,
+                                                   metrics=self.metrics):
+                        hrefs = [u for attr, u in parser.pop_links() if attr == 'href']
+                        links.extend(hrefs)
+                        await self.addurls([(u, url) for u in hrefs])
+                    if self.findimages:
+                        img_data = parser.pop_tags()
+
+                if parse:
+                    etag = resp.headers.get('etag')
+                    last_modified = resp.headers.get('last-modified')
+                    if self.use_lastmodified:
+                        lastmod = last_modified
+
+            if body is not None:
+                # Parsed after the response is released, its connection
+                # serves other requests meanwhile
+                links, img_data = await self.parsebody(body)
+                await self.addurls([(u, url) for u in links])
         except Exception as exc:
             # on any exception mark url as BAD
             print('...', url, 'has error', repr(str(exc)))
-            self.done[url] = [False, lastmod, cf, pr, imgs]
+            await self.markdone(url, DoneRecord(False))
         else:
-            # only url with status == 200 and content type == 'text/html' parsed
-            if (resp.status == 200 and
-                    ('text/html' in resp.headers.get('content-type'))):
-                data = (await resp.read()).decode('utf-8', 'replace')
-                urls = re.findall(r'(?i)href=["\']?([^\s"\'<>]+)', data)
-
-                if self.use_lastmodified:
-                    lastmod = resp.headers.get('last-modified')
-
-                if self.findimages:
-                    # Ref: https://support.google.com/webmasters/answer/178636?hl=en
-                    img_data = await self.fetchtags(
-                                data, url, 'img',
-                                fields=['src', 'title', 'caption', 'geo_location', 'license']
-                    )
-                    imgs = await self.addtagdata(
-                            tagdata=img_data, url=url,
-                            source_url_field='src', mimetype='^image\/',
-                            tag_root_urls=self.image_root_urls,
-                            excludes=self.exclude_imgs,
-                            done_list=self.done_images,
-                            this_domain=self.images_this_domain
-                    )
-
-                asyncio.Task(self.addurls([(u, url) for u in urls]))
-
-                try: pr = await self.urldict(url, self.changefreq)
-                except IndexError: pass
-
-                try: cf = await self.urldict(url, self.priorities)
-                except IndexError: pass
-
-            # even if we have no exception, we can mark url as good
-            resp.close()
-
-            self.done[url] = [True, lastmod, cf, pr, imgs]
+            if not_modified:
+                # Images of the page were valid in the previous crawl; list
+                # the ones no other page listed yet
+                imgs = [tag for tag in img_data if self.done_images.add(url, tag)]
+            elif parse and self.findimages:
+                # Images are checked after the page response is released,
+                # the probes need fetcher slots of their own
+                imgs = await self.addtagdata(
+                        tagdata=img_data, url=url,
+                        source_url_field='src', mimetype='^image\/',
+                        tag_root_urls=self.image_root_urls,
+                        excludes=self.exclude_img_rules,
+                        done_list=self.done_images,
+                        this_domain=self.images_this_domain
+                )
+
+            if self.incremental and not not_modified:
+                if parse and (etag or last_modified):
+                    # addtagdata() made image srcs absolute; keep every valid
+                    # image of the page, also those listed on other pages
+                    valid = {}
+                    for tag in img_data:
+                        if tag.get('src') and tag['src'] not in valid and tag['src'] in self.done_images:
+                            valid[tag['src']] = tag
+                    self.state.set_page(url, etag, last_modified, links, list(valid.values()))
+                else:
+                    self.state.delete_page(url)
+
+            if parse or not_modified:
+                with self.metrics.timer('rules'):
+                    cf = self.changefreq_rules.lookup(url)
+                    pr = self.priority_rules.lookup(url)
+
+            # without an exception or an error status the url is good
+            await self.markdone(url, DoneRecord(status < 400, lastmod, cf, pr, imgs))
 
         self.busy.remove(url)
-        logging.info(len(self.done), 'completed tasks,', len(self.tasks),
-              'still pending, todo_queue', len(self.todo_queue))
+        logging.info('%d completed tasks, %d in progress, %d in queue',
+                     len(self.done), len(self.busy), len(self.todo_queue))
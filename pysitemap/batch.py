@@ -0,0 +1,165 @@
+import asyncio
+import os
+import signal
+import time
+
+from pysitemap.base_crawler import Crawler
+from pysitemap.fetcher import Fetcher, FairLimiter
+from pysitemap.metrics import Metrics, progress_line, render, serve
+
+
+def resolves_inside(path, directory):
+    """
+    Whether path, with symbolic links and '..' resolved, is inside directory
+    """
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([os.path.realpath(path), directory]) == directory
+
+
+class BatchCrawler(object):
+    """
+    Crawls many domains concurrently in one event loop, each into its own
+    sitemap file.
+
+    All crawlers share one Fetcher: a single connection pool and a global
+    budget of maxtasks concurrent requests, handed out round-robin across
+    hosts by a FairLimiter so a large site cannot starve the small ones.
+    """
+
+    def __init__(self, domains, out_dir, out_format='xml', scheme='https', maxtasks=50, domain_tasks=10,
+                 limit_per_host=10, headers=None, verifyssl=True, request_timeout=30, delay=0,
+                 progress_interval=10, metrics_port=None, sitemap_base_url=None, **options):
+        """
+        :param domains: domain names, e.g. ['example.com', 'example.org']
+        :type domains: list
+        :param out_dir: directory of the sitemaps, named after their domain
+        :type out_dir: str
+        :param out_format: sitemap type [xml | txt | xml.gz | txt.gz]. Default xml
+        :type out_format: str
+        :param scheme: scheme of the domain root urls. Default https
+        :type scheme: str
+        :param maxtasks: maximum count of concurrent requests over all domains
+        :type maxtasks: int
+        :param domain_tasks: count of workers per domain
+        :type domain_tasks: int
+        :param limit_per_host: maximum count of connections per host, 0 for no limit
+        :type limit_per_host: int
+        :param headers: Send these headers in every request
+        :type headers: dict
+        :param verifyssl: verify website certificates?
+        :type verifyssl: bool
+        :param request_timeout: total seconds per request
+        :type request_timeout: float
+        :param delay: minimum seconds between two requests to the same host
+        :type delay: float
+        :param progress_interval: seconds between progress lines of the whole batch, None for none
+        :type progress_interval: float
+        :param metrics_port: serve Prometheus metrics, labelled by domain, at
+            http://127.0.0.1:metrics_port/metrics during the crawl
+        :type metrics_port: int
+        :param sitemap_base_url: url the sitemap files of a domain are published under, {domain} is replaced
+            with the domain, e.g. 'https://example.net/sitemaps/{domain}/'. Default the root url of the domain
+        :type sitemap_base_url: str
+        :param options: further Crawler options, applied to every domain
+        """
+        self.metrics = Metrics()
+        self.fetcher = Fetcher(maxtasks=maxtasks, limit_per_host=limit_per_host, headers=headers,
+                               verifyssl=verifyssl, timeout=request_timeout, delay=delay,
+                               limiter=FairLimiter(maxtasks), metrics=self.metrics)
+        self.progress_interval = progress_interval
+        self.metrics_port = metrics_port
+        self.started = None
+        self.crawlers = {}
+        for domain in domains:
+            out_file = os.path.join(out_dir, '{}.{}'.format(domain.replace(':', '_'), out_format))
+            if not resolves_inside(out_file, out_dir):
+                raise ValueError('sitemap of {!r} would be written outside of {}'.format(domain, out_dir))
+            base_url = sitemap_base_url.format(domain=domain) if sitemap_base_url else None
+            self.crawlers[domain] = Crawler('{}://{}/'.format(scheme, domain), out_file, out_format=out_format,
+                                            maxtasks=domain_tasks, headers=headers, fetcher=self.fetcher,
+                                            progress_interval=None, sitemap_base_url=base_url, **options)
+
+    @classmethod
+    def from_group(cls, group, out_dir, **options):
+        """
+        :param group: DomainGroup whose domains are crawled
+        :type group: pysitemap.models.DomainGroup
+        """
+        return cls([domain.domain for domain in group.domains], out_dir, **options)
+
+    async def run(self):
+        """
+        Crawl all domains
+        :return: dictionary, where key is domain and value is the exception which ended its crawl or None
+        """
+        self.started = time.monotonic()
+        await self.fetcher.open()
+        reporter = asyncio.ensure_future(self.report()) if self.progress_interval else None
+        metrics_server = None
+        try:
+            if self.metrics_port is not None:
+                metrics_server = await serve(lambda: render(self.metric_sources()), self.metrics_port)
+            results = await asyncio.gather(*(crawler.run() for crawler in self.crawlers.values()),
+                                           return_exceptions=True)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await self.fetcher.close()
+        if self.progress_interval:
+            print('progress:', self.progress())
+        return dict(zip(self.crawlers, results))
+
+    def metric_sources(self, labels=None):
+        """
+        :param labels: labels of all sources, e.g. {'job': job_id}
+        :return: (labels, metrics) pairs: those of the shared fetcher, and of each domain
+        """
+        labels = labels or {}
+        sources = [(labels, self.metrics)]
+        for domain, crawler in self.crawlers.items():
+            sources.append((dict(labels, domain=domain), crawler.metrics))
+        return sources
+
+    def progress(self):
+        return progress_line([metrics for _labels, metrics in self.metric_sources()],
+                             time.monotonic() - self.started)
+
+    async def report(self):
+        """
+        Periodically print a progress line of all domains
+        """
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            print('progress:', self.progress())
+
+    def stop(self):
+        for crawler in self.crawlers.values():
+            crawler.stop()
+
+
+def crawl_group(name, out_dir, **options):
+    """
+    Crawl all domains of the DomainGroup called name, see BatchCrawler
+    for options
+    """
+    from pysitemap.db import session
+    from pysitemap.models import DomainGroup
+    from sqlalchemy.orm import selectinload
+
+    group = session.query(DomainGroup).options(selectinload(DomainGroup.domains)).filter_by(name=name).one()
+    batch = BatchCrawler.from_group(group, out_dir, **options)
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, batch.stop)
+    except (NotImplementedError, RuntimeError):
+        pass
+
+    results = loop.run_until_complete(batch.run())
+    for domain, crawler in batch.crawlers.items():
+        error = results[domain]
+        print(domain, 'done:', len(crawler.done), '; ok:', sum(record.ok for record in crawler.done.values()),
+              '' if error is None else '; error: {!r}'.format(error))
+    return results
@@ -0,0 +1,273 @@
+import asyncio
+import time
+import urllib.parse
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted AIMD-style: the limit grows by one slot per
+    window of successful requests and is halved on errors, 429/503
+    responses or when the average latency goes over latency_target.
+    """
+
+    def __init__(self, maximum, minimum=1, latency_target=2.0, adaptive=True):
+        """
+        :param maximum: upper bound of concurrent requests
+        :type maximum: int
+        :param minimum: lower bound of concurrent requests
+        :type minimum: int
+        :param latency_target: average seconds to response headers considered healthy, None to ignore latency
+        :type latency_target: float
+        :param adaptive: adjust the limit at all? If not, it stays at maximum
+        :type adaptive: bool
+        """
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.latency_target = latency_target
+        self.adaptive = adaptive
+        self.limit = float(maximum)
+        self.inflight = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        self.condition = None
+
+    def open(self):
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, key=None):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def release(self, ok=True, latency=None):
+        async with self.condition:
+            self.inflight -= 1
+            if self.adaptive:
+                self.adjust(ok, latency)
+            self.condition.notify_all()
+
+    def adjust(self, ok, latency):
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        slow = self.latency_target is not None and self.latency is not None and self.latency > self.latency_target
+
+        if ok and not slow:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            return
+
+        # Requests which were in flight together report the same congestion,
+        # cut the limit only once per second
+        now = time.monotonic()
+        if now - self.last_decrease >= 1:
+            self.limit = max(self.minimum, self.limit / 2)
+            self.last_decrease = now
+
+
+class FairLimiter:
+    """
+    Global concurrency budget shared round-robin: when all slots are taken,
+    a freed slot goes to the next key (host) with waiting requests, so one
+    large site cannot starve the others.
+    """
+
+    def __init__(self, maximum):
+        """
+        :param maximum: upper bound of concurrent requests over all keys
+        :type maximum: int
+        """
+        self.maximum = maximum
+        self.inflight = 0
+        # key -> futures of waiting requests, in round-robin order
+        self.waiters = OrderedDict()
+
+    def open(self):
+        pass
+
+    async def acquire(self, key=None):
+        if self.inflight < self.maximum and not self.waiters:
+            self.inflight += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted to a cancelled request, pass it on
+                self.inflight -= 1
+                self.grant()
+            raise
+
+    async def release(self, ok=True, latency=None):
+        self.inflight -= 1
+        self.grant()
+
+    def grant(self):
+        while self.inflight < self.maximum and self.waiters:
+            key, waiters = next(iter(self.waiters.items()))
+            self.waiters.move_to_end(key)
+            future = waiters.popleft()
+            if not waiters:
+                del self.waiters[key]
+            if future.cancelled():
+                continue
+            self.inflight += 1
+            future.set_result(None)
+
+
+class Fetcher:
+    """
+    HTTP fetch layer of the crawler: one connection pool with per host
+    limits, DNS cache and keep-alive tuning, request timeouts, per host
+    politeness delay, adaptive concurrency and backoff on 429/503.
+    """
+
+    # Responses meaning the server wants us to slow down
+    backoff_statuses = (429, 503)
+
+    def __init__(self, maxtasks=10, limit_per_host=0, headers=None, verifyssl=True, timeout=30,
+                 connect_timeout=10, ttl_dns_cache=300, keepalive_timeout=30, delay=0, retries=2,
+                 adaptive=True, latency_target=2.0, limiter=None, metrics=None):
+        """
+        :param maxtasks: maximum count of concurrent requests
+        :type maxtasks: int
+        :param limit_per_host: maximum count of connections per host, 0 for no limit
+        :type limit_per_host: int
+        :param headers: Send these headers in every request
+        :type headers: dict
+        :param verifyssl: verify website certificate?
+        :type verifyssl: bool
+        :param timeout: total seconds per request, including the body
+        :type timeout: float
+        :param connect_timeout: seconds to get a connection
+        :type connect_timeout: float
+        :param ttl_dns_cache: seconds to keep resolved host names
+        :type ttl_dns_cache: int
+        :param keepalive_timeout: seconds to keep idle connections open
+        :type keepalive_timeout: float
+        :param delay: minimum seconds between two requests to the same host
+        :type delay: float
+        :param retries: how many times a failed or throttled (429/503) request is retried
+        :type retries: int
+        :param adaptive: adjust concurrency from observed latency and errors?
+        :type adaptive: bool
+        :param latency_target: average seconds to response headers considered healthy
+        :type latency_target: float
+        :param limiter: concurrency limiter, e.g. FairLimiter. Default AdaptiveLimiter of maxtasks
+        :param metrics: Metrics receiving request phase timings, statuses and received bytes
+        :type metrics: pysitemap.metrics.Metrics
+        """
+        self.maxtasks = maxtasks
+        self.limit_per_host = limit_per_host
+        self.headers = headers
+        self.verifyssl = verifyssl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.delay = delay
+        self.retries = retries
+        self.limiter = limiter or AdaptiveLimiter(maxtasks, latency_target=latency_target, adaptive=adaptive)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.gauge('requests_in_flight', lambda: self.limiter.inflight)
+        # host -> minimum seconds between requests, and earliest time of the next request
+        self.host_delays = {}
+        self.host_next = {}
+        self.session = None
+
+    async def open(self):
+        """
+        Create connection pool, must be called from the running loop
+        """
+        self.limiter.open()
+        connector_options = {} if self.verifyssl else {'ssl': False}
+        trace_configs = [self.metrics.trace_config()] if self.metrics is not None else None
+        # connector stores cookies between requests and uses connection pool
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=self.timeout,
+            trace_configs=trace_configs,
+            connector=aiohttp.TCPConnector(
+                limit=self.maxtasks,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout,
+                **connector_options
+            )
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def wait_host(self, host):
+        """
+        Wait for our turn to send a request to host
+        """
+        delay = self.host_delays.get(host, self.delay)
+        now = time.monotonic()
+        start = max(now, self.host_next.get(host, 0))
+        if delay or start > now:
+            self.host_next[host] = start + delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def backoff(self, host, resp, attempt):
+        """
+        Keep host quiet for Retry-After seconds or for an exponentially
+        growing time
+        """
+        try:
+            seconds = float(resp.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            seconds = 2 ** attempt
+        self.host_next[host] = max(self.host_next.get(host, 0), time.monotonic() + seconds)
+
+    @asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        """
+        Send request and yield the response; the concurrency slot is held
+        until the block exits, so the body should be read inside of it
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        attempt = 0
+        while True:
+            await self.wait_host(host)
+            await self.limiter.acquire(host)
+            started = time.monotonic()
+            try:
+                resp = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await self.limiter.release(ok=False)
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                await self.limiter.release(ok=False)
+                raise
+
+            latency = time.monotonic() - started
+            headers_received = time.perf_counter()
+            if resp.status in self.backoff_statuses:
+                self.backoff(host, resp, attempt)
+                if attempt < self.retries:
+                    resp.release()
+                    await self.limiter.release(ok=False, latency=latency)
+                    attempt += 1
+                    continue
+
+            try:
+                yield resp
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe('body', time.perf_counter() - headers_received)
+                    self.metrics.count('received_bytes_total', resp.content.total_bytes)
+                resp.release()
+                await self.limiter.release(ok=resp.status not in self.backoff_statuses, latency=latency)
+            return
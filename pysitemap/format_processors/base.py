@@ -0,0 +1,194 @@
+import asyncio
+import os
+import urllib.parse
+from datetime import datetime, timezone, timedelta
+from xml.sax.saxutils import escape
+from aiofile import AIOFile, Writer
+
+
+class BaseWriter():
+    """
+    Sitemap writer. Entries are written into temporary files next to
+    filename, which are moved into place atomically on close().
+
+    Output over max_urls entries or max_bytes is split into numbered
+    shards (sitemap-1.xml, sitemap-2.xml, ...) and filename becomes a
+    sitemap index referencing them.
+
+    Entries are collected in a buffer and written in blocks of
+    buffer_size bytes; every file is fsynced once, when it is complete.
+
+    Either call write() with all entries at once, or open(), add() every
+    entry as it is ready and close().
+    """
+
+    # extension kept after the shard number
+    suffix = ''
+
+    def __init__(self, filename: str, max_urls=50000, max_bytes=50 * 1024 * 1024, base_url=None,
+                 buffer_size=1024 * 1024):
+        """
+        :param filename: path of the sitemap, or of the sitemap index if output is sharded
+        :param max_urls: maximum count of urls per sitemap file. Default 50000
+        :param max_bytes: maximum uncompressed size of sitemap file. Default 50 MiB
+        :param base_url: url the sitemap files are published under, used in the sitemap index
+        :param buffer_size: bytes collected before they are written to the file. Default 1 MiB
+        """
+        self.filename = filename
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.base_url = base_url
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.timezone_offset = 0
+        self.shards = []
+        self.closing = []
+        self.aiodf = None
+        self.writer = None
+        self.encoder = None
+        self.urls = 0
+        self.size = 0
+
+    def header(self):
+        return ''
+
+    def footer(self):
+        return ''
+
+    def format_entry(self, url, record):
+        raise NotImplementedError
+
+    def new_encoder(self):
+        """
+        State kept by encode() for one file
+        """
+        return None
+
+    async def encode(self, encoder, data, final=False):
+        """
+        Transform a block of file contents before it is written, e.g. compress it
+        :param final: is this the last block of the file?
+        """
+        return data
+
+    @property
+    def index_filename(self):
+        return self.filename
+
+    def split_filename(self):
+        """
+        :return: filename without its extension, and the extension
+        """
+        if self.suffix and self.filename.endswith(self.suffix):
+            return self.filename[:-len(self.suffix)], self.suffix
+        return os.path.splitext(self.filename)
+
+    def shard_filename(self, number):
+        stem, suffix = self.split_filename()
+        return '{}-{}{}'.format(stem, number, suffix)
+
+    @property
+    def filenames(self):
+        """
+        Files of the finished sitemap, the sitemap index last
+        """
+        if len(self.shards) == 1:
+            return [self.filename]
+        return self.shards + [self.index_filename]
+
+    @property
+    def tmp_filenames(self):
+        return [shard + '.tmp' for shard in self.shards]
+
+    async def open(self, timezone_offset=0):
+        self.timezone_offset = timezone_offset
+        self.shards = []
+        self.closing = []
+        self.footer_bytes = self.footer().encode('utf-8')
+        await self.open_shard()
+
+    async def open_shard(self):
+        self.shards.append(self.shard_filename(len(self.shards) + 1))
+        self.aiodf = AIOFile(self.shards[-1] + '.tmp', 'wb')
+        await self.aiodf.open()
+        self.writer = Writer(self.aiodf)
+        self.encoder = self.new_encoder()
+        header = self.header().encode('utf-8')
+        self.urls = 0
+        self.size = len(header)
+        self.buffer = [header]
+        self.buffered = len(header)
+
+    async def close_shard(self, aiodf, writer, encoder, buffer, complete=True):
+        if complete:
+            buffer.append(self.footer_bytes)
+        await writer(await self.encode(encoder, b''.join(buffer), final=True))
+        await aiodf.fsync()
+        await aiodf.close()
+
+    async def flush(self):
+        """
+        Write buffered entries to the current file
+        """
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        await self.writer(await self.encode(self.encoder, data))
+
+    async def add(self, url, record):
+        data = self.format_entry(url, record).encode('utf-8')
+        if self.urls and (self.urls >= self.max_urls or
+                          self.size + len(data) + len(self.footer_bytes) > self.max_bytes):
+            # The full shard is finished in the background while the next one fills
+            self.closing.append(asyncio.ensure_future(self.close_shard(
+                self.aiodf, self.writer, self.encoder, self.buffer)))
+            await self.open_shard()
+        self.buffer.append(data)
+        self.buffered += len(data)
+        self.urls += 1
+        self.size += len(data)
+        if self.buffered >= self.buffer_size:
+            await self.flush()
+
+    async def close(self, complete=True):
+        """
+        Finish the files. If the crawl did not complete, the entries written
+        so far are left in the temporary files
+        """
+        await self.close_shard(self.aiodf, self.writer, self.encoder, self.buffer, complete)
+        await asyncio.gather(*self.closing)
+        if not complete:
+            return
+
+        if len(self.shards) == 1:
+            os.replace(self.tmp_filenames[0], self.filename)
+            return
+
+        for shard, tmp_filename in zip(self.shards, self.tmp_filenames):
+            os.replace(tmp_filename, shard)
+        await self.write_index()
+
+    async def write_index(self):
+        """
+        Write sitemap index referencing all shards
+        """
+        lastmod = datetime.now(timezone(timedelta(hours=self.timezone_offset))).replace(microsecond=0).isoformat()
+        tmp_filename = self.index_filename + '.tmp'
+        index = ['<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        for shard in self.shards:
+            loc = urllib.parse.urljoin(self.base_url or '', os.path.basename(shard))
+            index.append('<sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>\n'.format(escape(loc), lastmod))
+        index.append('</sitemapindex>')
+        data = await self.encode(self.new_encoder(), ''.join(index).encode('utf-8'), final=True)
+        async with AIOFile(tmp_filename, 'wb') as aiodf:
+            await Writer(aiodf)(data)
+            await aiodf.fsync()
+        os.replace(tmp_filename, self.index_filename)
+
+    async def write(self, urls, timezone_offset=0):
+        await self.open(timezone_offset)
+        for url, record in urls:
+            await self.add(url, record)
+        await self.close()
@@ -0,0 +1,54 @@
+import asyncio
+import zlib
+
+from pysitemap.format_processors.xml import XMLWriter
+from pysitemap.format_processors.text import TextWriter
+
+
+class GzipMixin(object):
+    """
+    Writes gzip files, compressing blocks incrementally as they are
+    flushed. Compression runs in the default executor, off the event loop.
+    A filename without the .gz extension gets it, e.g. sitemap.xml is
+    written as sitemap.xml.gz
+    """
+
+    def __init__(self, filename, compresslevel=6, **kwargs):
+        """
+        :param compresslevel: zlib compression level, 1 (fastest) to 9 (smallest). Default 6
+        :type compresslevel: int
+        """
+        if not filename.endswith('.gz'):
+            filename += '.gz'
+        super().__init__(filename, **kwargs)
+        self.compresslevel = compresslevel
+
+    def new_encoder(self):
+        # wbits 31: deflate with gzip header and trailer
+        return zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+
+    @staticmethod
+    def compress(encoder, data, final):
+        block = encoder.compress(data)
+        if final:
+            block += encoder.flush()
+        return block
+
+    async def encode(self, encoder, data, final=False):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.compress, encoder, data, final)
+
+
+class XMLGzipWriter(GzipMixin, XMLWriter):
+
+    suffix = '.xml.gz'
+
+
+class TextGzipWriter(GzipMixin, TextWriter):
+
+    suffix = '.txt.gz'
+
+    @property
+    def index_filename(self):
+        stem, _suffix = self.split_filename()
+        return stem + '-index.xml.gz'
@@ -1,18 +1,15 @@
-import asyncio
-from aiofile import AIOFile, Reader, Writer
-import logging
+from pysitemap.format_processors.base import BaseWriter
 
 
-class TextWriter():
-    def __init__(self, filename: str):
-        self.filename = filename
+class TextWriter(BaseWriter):
 
+    suffix = '.txt'
 
-    async def write(self, urls):
-        async with AIOFile(self.filename, 'w') as aiodf:
-            writer = Writer(aiodf)
-
-            for url in urls:
-                await writer("{}\n".format(url))
-            await aiodf.fsync()
+    @property
+    def index_filename(self):
+        # A sitemap index is always xml
+        stem, _suffix = self.split_filename()
+        return stem + '-index.xml'
 
+    def format_entry(self, url, record):
+        return "{}\n".format(url)
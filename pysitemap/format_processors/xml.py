@@ -1,56 +1,69 @@
-import asyncio
-from aiofile import AIOFile, Reader, Writer
-import logging
-from datetime import datetime, timezone, timedelta
+from datetime import timezone, timedelta
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from pysitemap.format_processors.base import BaseWriter
 
-class XMLWriter():
-    def __init__(self, filename: str):
-        self.filename = filename
 
+# (image tag field, sitemap element)
+IMAGE_ELEMENTS = (
+    ('src', 'loc'),
+    ('title', 'title'),
+    ('caption', 'caption'),
+    ('geo_location', 'geo_location'),
+    ('license', 'license'),
+)
 
-    async def write(self, urls, timezone_offset):
-        async with AIOFile(self.filename, 'w') as aiodf:
-            writer = Writer(aiodf)
-            await writer('<?xml version="1.0" encoding="utf-8"?>\n')
-            await writer(
+
+@lru_cache(maxsize=4096)
+def format_lastmod(value, timezone_offset=0):
+    """
+    Convert Last-Modified header value to W3C datetime in the given timezone.
+    Values which are not HTTP dates are returned as they are
+    """
+    try:
+        timestamp = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return value
+    if timestamp is None:
+        return value
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(tz=timezone(timedelta(hours=timezone_offset))).isoformat()
+
+
+class XMLWriter(BaseWriter):
+
+    suffix = '.xml'
+
+    def header(self):
+        return ('<?xml version="1.0" encoding="utf-8"?>\n'
                 '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
                 ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
                 ' xsi:schemaLocation="http://www.sitemaps.org/schemas/sitemap/0.9 http://www.sitemaps.org/schemas/sitemap/0.9/sitemap.xsd"'
                 ' xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n')
-            await aiodf.fsync()
-            for data in urls:
-
-                timestamp  = data[1][1]
-                changefreq = data[1][2]
-                priority   = data[1][3]
-                image_data = data[1][4]
-
-                url = "<loc>{}</loc>".format(data[0])
-
-                if timestamp is not None:
-                    timestamp = datetime.strptime(timestamp, "%a, %d %b %Y %H:%M:%S %Z").astimezone(tz=timezone(timedelta(hours=timezone_offset))).isoformat()
-                    url += "<lastmod>{}</lastmod>".format(str(timestamp))
 
-                if changefreq is not None:
-                    url += "<changefreq>{}</changefreq>".format(str(changefreq))
+    def footer(self):
+        return '</urlset>'
 
-                if priority is not None:
-                    url += "<priority>{}</priority>".format(str(priority))
+    def format_entry(self, loc, record):
+        parts = ['<url><loc>', escape(loc), '</loc>']
 
-                if len(image_data) > 0:
-                    for image in image_data:
-                        image_xml = ""
-                        if 'src' in image:          image_xml += "<image:loc>{}</image:loc>".format(image['src'])
-                        if 'title' in image:        image_xml += "<image:title>{}</image:title>".format(image['title'])
-                        if 'caption' in image:      image_xml += "<image:caption>{}</image:caption>".format(image['caption'])
-                        if 'geo_location' in image: image_xml += "<image:geo_location>{}</image:geo_location>".format(image['geo_location'])
-                        if 'license' in image:      image_xml += "<image:license>{}</image:license>".format(image['license'])
+        if record.lastmod is not None:
+            parts += ['<lastmod>', escape(format_lastmod(record.lastmod, self.timezone_offset)), '</lastmod>']
 
-                        url += "<image:image>{}</image:image>".format(image_xml)
+        if record.changefreq is not None:
+            parts += ['<changefreq>', str(record.changefreq), '</changefreq>']
 
-                await writer('<url>{}</url>\n'.format(url))
+        if record.priority is not None:
+            parts += ['<priority>', str(record.priority), '</priority>']
 
-            await aiodf.fsync()
+        for image in record.images:
+            parts.append('<image:image>')
+            for field, element in IMAGE_ELEMENTS:
+                if field in image:
+                    parts += ['<image:', element, '>', escape(image[field]), '</image:', element, '>']
+            parts.append('</image:image>')
 
-            await writer('</urlset>')
-            await aiodf.fsync()
+        parts.append('</url>\n')
+        return ''.join(parts)
@@ -0,0 +1,237 @@
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+import aiohttp
+from aiohttp import web
+
+# HELP lines of the Prometheus metrics, names without the pysitemap_ prefix
+HELP = {
+    'phase_seconds': 'Seconds spent per crawl phase',
+    'responses_total': 'HTTP responses by status code',
+    'received_bytes_total': 'Response body bytes received',
+    'request_errors_total': 'Requests failed with a connection error or timeout',
+    'queue_depth': 'Urls waiting in the frontier',
+    'pages_in_flight': 'Pages being processed',
+    'requests_in_flight': 'Requests holding a concurrency slot',
+    'done_urls': 'Urls processed',
+    'jobs_running': 'Crawl jobs running',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """
+    Counts of observed durations per bucket, Prometheus style: a value is
+    counted in the first bucket whose upper bound is not below it
+    """
+
+    # upper bounds of the buckets in seconds, the last bucket is +Inf
+    bounds = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: (upper bound, count of values up to it) pairs, +Inf last
+        """
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Timer:
+    """
+    Context manager adding the seconds spent in its block to a phase
+    """
+
+    __slots__ = ('metrics', 'phase', 'started')
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.phase, time.perf_counter() - self.started)
+
+
+class Metrics:
+    """
+    Crawl metrics: duration histograms per phase, counters and gauges.
+
+    Phases of requests (dns, connect, ttfb) are measured by an aiohttp
+    TraceConfig, the fetcher adds body (from response headers until the
+    response is released), the crawler parse, rules and write. Gauges are
+    functions, read when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.histograms = OrderedDict()
+        self.statuses = Counter()
+        self.counters = Counter()
+        self.gauges = OrderedDict()
+
+    def observe(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = Histogram()
+        histogram.observe(seconds)
+
+    def timer(self, phase):
+        return Timer(self, phase)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def gauge(self, name, func):
+        """
+        :param func: function returning the current value of the gauge
+        """
+        self.gauges[name] = func
+
+    def trace_config(self):
+        """
+        :return: aiohttp TraceConfig feeding these metrics, for ClientSession(trace_configs=...)
+        """
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self.on_request_start)
+        trace_config.on_dns_resolvehost_start.append(self.on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(self.on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(self.on_connection_create_start)
+        trace_config.on_connection_create_end.append(self.on_connection_create_end)
+        trace_config.on_request_end.append(self.on_request_end)
+        trace_config.on_request_exception.append(self.on_request_exception)
+        return trace_config
+
+    async def on_request_start(self, session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_dns_resolvehost_start(self, session, context, params):
+        context.dns_started = time.perf_counter()
+
+    async def on_dns_resolvehost_end(self, session, context, params):
+        self.observe('dns', time.perf_counter() - context.dns_started)
+
+    async def on_connection_create_start(self, session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(self, session, context, params):
+        # includes the DNS lookup and the TLS handshake
+        self.observe('connect', time.perf_counter() - context.connect_started)
+
+    async def on_request_end(self, session, context, params):
+        # from the request until its response headers arrived
+        self.observe('ttfb', time.perf_counter() - context.started)
+        self.statuses[params.response.status] += 1
+
+    async def on_request_exception(self, session, context, params):
+        self.count('request_errors_total')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape_label(value)) for name, value in labels.items()) + '}'
+
+
+def render(sources):
+    """
+    Prometheus text exposition of several Metrics
+    :param sources: (labels, metrics) pairs, the label dictionaries tell the sources apart
+    :return: str
+    """
+    families = OrderedDict()
+
+    def sample(family, kind, name, labels, value):
+        if family not in families:
+            families[family] = ['# HELP pysitemap_{} {}'.format(family, HELP.get(family, family)),
+                                '# TYPE pysitemap_{} {}'.format(family, kind)]
+        families[family].append('pysitemap_{}{} {}'.format(name, format_labels(labels), value))
+
+    for labels, metrics in sources:
+        for phase, histogram in metrics.histograms.items():
+            phase_labels = dict(labels, phase=phase)
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                sample('phase_seconds', 'histogram', 'phase_seconds_bucket', dict(phase_labels, le=le), count)
+            sample('phase_seconds', 'histogram', 'phase_seconds_sum', phase_labels, repr(histogram.sum))
+            sample('phase_seconds', 'histogram', 'phase_seconds_count', phase_labels, histogram.count)
+        for status, count in sorted(metrics.statuses.items()):
+            sample('responses_total', 'counter', 'responses_total', dict(labels, status=status), count)
+        for name, value in metrics.counters.items():
+            sample(name, 'counter', name, labels, value)
+        for name, func in metrics.gauges.items():
+            sample(name, 'gauge', name, labels, func())
+
+    return ''.join(line + '\n' for lines in families.values() for line in lines)
+
+
+def progress_line(sources, elapsed):
+    """
+    One line summary of a crawl: progress, throughput, responses and the
+    average duration of every phase
+    :param sources: Metrics of the crawl
+    :param elapsed: seconds since the crawl started
+    """
+    gauges = Counter()
+    statuses = Counter()
+    counters = Counter()
+    phases = OrderedDict()
+    for metrics in sources:
+        for name, func in metrics.gauges.items():
+            gauges[name] += func()
+        statuses.update(metrics.statuses)
+        counters.update(metrics.counters)
+        for phase, histogram in metrics.histograms.items():
+            total, count = phases.get(phase, (0.0, 0))
+            phases[phase] = (total + histogram.sum, count + histogram.count)
+
+    parts = [
+        '{} done'.format(gauges['done_urls']),
+        '{} queued'.format(gauges['queue_depth']),
+        '{} in flight'.format(gauges['pages_in_flight']),
+        '{:.1f} urls/s'.format(gauges['done_urls'] / elapsed if elapsed > 0 else 0),
+        '{:.1f} MiB'.format(counters['received_bytes_total'] / (1024 * 1024)),
+    ]
+    if statuses:
+        parts.append('status ' + ' '.join('{}:{}'.format(status, count) for status, count in sorted(statuses.items())))
+    if counters['request_errors_total']:
+        parts.append('{} errors'.format(counters['request_errors_total']))
+    for phase, (total, count) in phases.items():
+        if count:
+            parts.append('{} {:.2f} ms'.format(phase, total / count * 1000))
+    return ', '.join(parts)
+
+
+async def serve(render_func, port, host='127.0.0.1'):
+    """
+    Serve GET /metrics with the output of render_func
+    :return: aiohttp AppRunner, cleanup() stops the server
+    """
+    async def handler(request):
+        return web.Response(body=render_func().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
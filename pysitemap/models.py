@@ -1,15 +1,15 @@
 from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, exists
 from sqlalchemy.orm import relationship
 import hashlib
-from db import Model, db_endine, session
+from pysitemap.db import Model, db_endine, session
 import uuid
-from validators import domain as domain_validator
+from pysitemap.validators import domain as domain_validator
 
 groups_domains = Table(
     'groups_domains',
     Model.metadata,
-    Column('domain_id', Integer, ForeignKey('domain_groups.id')),
-    Column('group_id', Integer, ForeignKey('domains.id'))
+    Column('group_id', Integer, ForeignKey('domain_groups.id')),
+    Column('domain_id', Integer, ForeignKey('domains.id'))
 )
 
 
@@ -36,7 +36,7 @@ class Domain(Model):
 
     id = Column(Integer, primary_key=True)
     domain = Column(String(200), nullable=False)
-    domains = relationship("DomainGroup", secondary=groups_domains, back_populates="domains")
+    groups = relationship("DomainGroup", secondary=groups_domains, back_populates="domains")
 
     def __init__(self, domain):
         self.validate_domain(domain)
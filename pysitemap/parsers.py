@@ -0,0 +1,289 @@
+import codecs
+import os
+import time
+import urllib.parse
+import zlib
+from html.parser import HTMLParser
+from xml.etree.ElementTree import XMLPullParser
+
+from pysitemap.backends.done import DoneRecord
+
+CHUNK_SIZE = 64 * 1024
+
+# Ref: https://support.google.com/webmasters/answer/178636?hl=en
+IMAGE_FIELDS = ('src', 'title', 'caption', 'geo_location', 'license')
+
+# image:image child elements -> image tag fields
+SITEMAP_IMAGE_FIELDS = {'loc': 'src', 'title': 'title', 'caption': 'caption',
+                        'geo_location': 'geo_location', 'license': 'license'}
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class LinkParser(HTMLParser):
+    """
+    Incremental html tokenizer which collects href and src values and
+    attributes of selected tags in a single pass.
+
+    Data can be fed in arbitrary pieces, collected values are taken out
+    with pop_links() and pop_tags() as soon as their tag has been seen.
+    Character references in attribute values are already resolved.
+    """
+
+    link_attrs = ('href', 'src')
+
+    def __init__(self, tag_fields=None):
+        """
+        :param tag_fields: dictionary, where key is tag name and value is list of attributes to collect
+        :type tag_fields: dict
+        """
+        super().__init__(convert_charrefs=True)
+        self.tag_fields = tag_fields or {}
+        self.links = []
+        self.found_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if value and name in self.link_attrs:
+                self.links.append((name, value.strip()))
+
+        fields = self.tag_fields.get(tag)
+        if fields:
+            found = {name: value for name, value in attrs if value is not None and name in fields}
+            if found:
+                self.found_tags.append(found)
+
+    def pop_links(self):
+        """
+        Return (attribute, value) pairs collected since the last call
+        """
+        links, self.links = self.links, []
+        return links
+
+    def pop_tags(self):
+        """
+        Return attribute dictionaries of tags collected since the last call
+        """
+        tags, self.found_tags = self.found_tags, []
+        return tags
+
+
+async def feed_stream(parser, stream, max_size=None, chunk_size=CHUNK_SIZE, encoding='utf-8', metrics=None):
+    """
+    Read response body chunk by chunk and feed it to parser
+    :param parser: HTMLParser instance
+    :param stream: aiohttp StreamReader, i.e. resp.content
+    :param max_size: stop reading after this many bytes, None for no limit
+    :param chunk_size: size of a single read
+    :param encoding: body encoding
+    :param metrics: Metrics receiving the seconds spent parsing the whole body, as phase parse
+    :return: async generator of decoded text pieces, yielded after they are fed
+    """
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    size = 0
+    # parse time of the body, without the waits for its chunks
+    elapsed = 0.0
+    async for chunk in stream.iter_chunked(chunk_size):
+        if max_size is not None and size + len(chunk) > max_size:
+            chunk = chunk[:max_size - size]
+        size += len(chunk)
+        started = time.perf_counter()
+        text = decoder.decode(chunk)
+        parser.feed(text)
+        elapsed += time.perf_counter() - started
+        yield text
+        if max_size is not None and size >= max_size:
+            break
+
+    started = time.perf_counter()
+    text = decoder.decode(b'', final=True)
+    parser.feed(text)
+    parser.close()
+    elapsed += time.perf_counter() - started
+    if metrics is not None:
+        metrics.observe('parse', elapsed)
+    yield text
+
+
+def parse_document(data, tag_fields=None, encoding='utf-8'):
+    """
+    Parse a whole html document. Defined at module level so process pool
+    executors can pickle it
+    :param data: document body
+    :type data: bytes
+    :param tag_fields: dictionary, where key is tag name and value is list of attributes to collect
+    :return: (list of href values, list of tag attribute dictionaries)
+    """
+    parser = LinkParser(tag_fields=tag_fields)
+    parser.feed(data.decode(encoding, 'replace'))
+    parser.close()
+    return [value for attr, value in parser.pop_links() if attr == 'href'], parser.pop_tags()
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class SitemapParser(object):
+    """
+    Incremental parser of sitemaps: xml urlsets, sitemap indexes and text
+    sitemaps, plain or gzip compressed.
+
+    Data can be fed in arbitrary pieces. Parsed elements are dropped as
+    soon as their entry is collected, so memory stays constant however
+    large the sitemap is. Entries are taken out with pop_urls() and
+    pop_sitemaps().
+    """
+
+    def __init__(self):
+        self.head = b''
+        self.detected = False
+        self.decompressor = None
+        self.parser = None
+        self.text = None
+        self.root = None
+        self.urls = []
+        self.sitemaps = []
+
+    def feed(self, data):
+        if not self.detected:
+            # Compression is known from the first two bytes
+            self.head += data
+            if len(self.head) < 2:
+                return
+            data = self.detect()
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+        self._feed(data)
+
+    def detect(self):
+        data, self.head = self.head, b''
+        self.detected = True
+        if data.startswith(GZIP_MAGIC):
+            self.decompressor = zlib.decompressobj(31)
+        return data
+
+    def _feed(self, data):
+        if self.parser is None and self.text is None:
+            # xml or text sitemap, known from the first non blank byte
+            data = data.lstrip()
+            if not data:
+                return
+            if data.startswith(b'<'):
+                self.parser = XMLPullParser(events=('start', 'end'))
+            else:
+                self.text = b''
+        if self.text is not None:
+            lines = (self.text + data).split(b'\n')
+            self.text = lines.pop()
+            self.add_lines(lines)
+        else:
+            self.parser.feed(data)
+            self.read_events()
+
+    def close(self):
+        data = self.detect() if not self.detected else b''
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data) + self.decompressor.flush()
+        if data:
+            self._feed(data)
+        if self.text:
+            self.add_lines([self.text])
+            self.text = b''
+        elif self.parser is not None:
+            self.parser.close()
+            self.read_events()
+
+    def add_lines(self, lines):
+        for line in lines:
+            url = line.strip().decode('utf-8', 'replace')
+            if url:
+                self.urls.append((url, DoneRecord(True)))
+
+    def read_events(self):
+        for event, elem in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = elem
+                continue
+            name = local_name(elem.tag)
+            if name == 'url':
+                self.add_url(elem)
+            elif name == 'sitemap':
+                loc = self.findtext(elem, 'loc')
+                if loc:
+                    self.sitemaps.append(loc)
+            else:
+                continue
+            # Entry collected, drop it from the tree
+            self.root.clear()
+
+    @staticmethod
+    def findtext(elem, name):
+        for child in elem:
+            if local_name(child.tag) == name:
+                return (child.text or '').strip()
+        return None
+
+    def add_url(self, elem):
+        loc = None
+        values = {}
+        images = []
+        for child in elem:
+            name = local_name(child.tag)
+            if name == 'image':
+                image = {}
+                for field in child:
+                    key = SITEMAP_IMAGE_FIELDS.get(local_name(field.tag))
+                    if key and field.text:
+                        image[key] = field.text.strip()
+                if 'src' in image:
+                    images.append(image)
+            elif name == 'loc':
+                loc = (child.text or '').strip()
+            elif child.text:
+                values[name] = child.text.strip()
+        if loc:
+            self.urls.append((loc, DoneRecord(True, values.get('lastmod'), values.get('changefreq'),
+                                              values.get('priority'), images)))
+
+    def pop_urls(self):
+        """
+        Return (url, DoneRecord) pairs of url entries collected since the last call
+        """
+        urls, self.urls = self.urls, []
+        return urls
+
+    def pop_sitemaps(self):
+        """
+        Return locations of sitemap index entries collected since the last call
+        """
+        sitemaps, self.sitemaps = self.sitemaps, []
+        return sitemaps
+
+
+def read_sitemap(filename, chunk_size=CHUNK_SIZE):
+    """
+    Read sitemap file in chunks. Sitemaps referenced by a sitemap index
+    are read from the directory of filename
+    :return: generator of (url, DoneRecord) pairs
+    """
+    parser = SitemapParser()
+    directory = os.path.dirname(filename)
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+            for entry in parser.pop_urls():
+                yield entry
+            for loc in parser.pop_sitemaps():
+                shard = os.path.join(directory, os.path.basename(urllib.parse.urlsplit(loc).path))
+                if os.path.exists(shard):
+                    yield from read_sitemap(shard, chunk_size)
+                else:
+                    print('sitemap', shard, 'listed in', filename, 'not found')
+            if not chunk:
+                break
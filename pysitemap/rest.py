@@ -1,18 +1,74 @@
+import asyncio
+import gzip
+import hashlib
 import inspect
+import os
+import re
+import shutil
+import time
+import urllib.parse
+import uuid
 from collections import OrderedDict
 
 import json
+from aiohttp import hdrs, web
 from aiohttp.http_exceptions import HttpBadRequest
-from aiohttp.web_exceptions import HTTPMethodNotAllowed
+from aiohttp.web_exceptions import HTTPMethodNotAllowed, HTTPBadRequest, HTTPNotFound, HTTPConflict
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response
 from aiohttp.web_routedef import UrlDispatcher
+from sqlalchemy.orm import selectinload
 
-from db import session, get_or_create
-from models import Domain, DomainGroup
+from pysitemap.batch import BatchCrawler, resolves_inside
+from pysitemap.db import session, get_or_create
+from pysitemap.metrics import CONTENT_TYPE, Metrics, render
+from pysitemap.models import Domain, DomainGroup
+from pysitemap.validators import ValidationFailure, domain as domain_validator
 
 DEFAULT_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
 
+# Crawl options a job may set
+JOB_OPTIONS = ('out_format', 'scheme', 'maxtasks', 'domain_tasks', 'limit_per_host', 'delay', 'request_timeout',
+               'exclude_urls', 'exclude_imgs', 'findimages', 'use_lastmodified', 'use_robots', 'seed_sitemaps',
+               'changefreq', 'priorities', 'timezone_offset', 'sitemap_max_urls', 'sitemap_base_url', 'verbose',
+               'progress_interval')
+
+
+async def run_db(func, *args):
+    """
+    Run blocking database work in a thread, off the event loop. The
+    scoped session of the thread is removed when it is done
+    """
+    def call():
+        try:
+            return func(*args)
+        finally:
+            session.remove()
+
+    return await asyncio.get_event_loop().run_in_executor(None, call)
+
+
+def page_params(request, default_limit=50, max_limit=500):
+    """
+    :return: offset and limit query parameters of a listing
+    """
+    try:
+        offset = int(request.query.get('offset', 0))
+        limit = min(int(request.query.get('limit', default_limit)), max_limit)
+    except ValueError:
+        raise HTTPBadRequest(text='offset and limit must be integers')
+    if offset < 0 or limit < 1:
+        raise HTTPBadRequest(text='offset must be >= 0 and limit >= 1')
+    return offset, limit
+
+
+def page(items, offset, limit):
+    """
+    Listing response of at most limit items, loaded with limit + 1 rows
+    """
+    return {'items': items[:limit], 'offset': offset, 'limit': limit,
+            'next_offset': offset + limit if len(items) > limit else None}
+
 
 class RestEndpoint:
 
@@ -49,28 +105,37 @@ class DomainEndpoint(RestEndpoint):
         super().__init__()
         self.resource = resource
 
-    async def get(self) -> Response:
-        data = []
-
-        domains = session.query(Domain).all()
-        for instance in self.resource.collection.values():
-            data.append(self.resource.render(instance))
+    @staticmethod
+    def list_domains(offset, limit):
+        domains = (session.query(Domain).options(selectinload(Domain.groups))
+                   .order_by(Domain.id).offset(offset).limit(limit + 1).all())
+        return [
+            {
+                'id': domain.id, 'title': domain.domain,
+                'groups': [{'id': group.id, 'name': group.name} for group in domain.groups]
+            } for domain in domains
+        ]
+
+    async def get(self, request) -> Response:
+        offset, limit = page_params(request)
+        domains = await run_db(self.list_domains, offset, limit)
+        data = page(domains, offset, limit)
+        data['domains'] = data.pop('items')
+        return Response(status=200, body=self.resource.encode(data), content_type='application/json')
 
-        return Response(status=200, body=self.resource.encode({
-            'domains': [
-                {
-                    'id': domain.id, 'title': domain.domain,
-                    'groups': [{'id': group.id, 'name': group.name} for group in domain.groups]
-                } for domain in session.query(Domain).all()
-            ]}), content_type='application/json')
+    @staticmethod
+    def create_domain(name):
+        domain, _created = get_or_create(session, Domain, domain=name)
+        return {'id': domain.id, 'domain': domain.domain, 'created': _created}
 
     async def post(self, request):
         data = await request.json()
-        domain, _created = get_or_create(Domain, domain=data['domain'])
+        try:
+            domain = await run_db(self.create_domain, data['domain'])
+        except (KeyError, ValidationFailure) as exc:
+            raise HTTPBadRequest(text=str(exc))
 
-        return Response(status=200, body=self.resource.encode(
-            {'id': domain.id, 'domain': domain.domain, 'created': _created},
-        ), content_type='application/json')
+        return Response(status=200, body=self.resource.encode(domain), content_type='application/json')
 
 
 class DomainGroupEndpoint(RestEndpoint):
@@ -78,33 +143,49 @@ class DomainGroupEndpoint(RestEndpoint):
         super().__init__()
         self.resource = resource
 
-    async def get(self) -> Response:
+    @staticmethod
+    def list_groups(offset, limit):
+        groups = (session.query(DomainGroup).options(selectinload(DomainGroup.domains))
+                  .order_by(DomainGroup.id).offset(offset).limit(limit + 1).all())
+        return [
+            {
+                'id': group.id, 'name': group.name,
+                'domains': [{'id': domain.id, 'name': domain.domain} for domain in group.domains]
+            } for group in groups
+        ]
+
+    async def get(self, request) -> Response:
+        offset, limit = page_params(request)
+        groups = await run_db(self.list_groups, offset, limit)
+        data = page(groups, offset, limit)
+        data['domain_groups'] = data.pop('items')
+        return Response(status=200, body=self.resource.encode(data), content_type='application/json')
 
-        return Response(status=200, body=self.resource.encode({
-            'domain_groups': [
-                {
-                    'id': group.id, 'name': group.name,
-                    'domains': [{'id': domain.id, 'name': domain.domain} for domain in group.domains]
-                } for group in session.query(DomainGroup).all()
-            ]}), content_type='application/json')
+    @staticmethod
+    def create_group(name, domain_names):
+        group, _created = get_or_create(session, DomainGroup, name=name)
+        domains = []
+        for domain_el in domain_names:
+            domain, _domain_created = get_or_create(session, Domain, domain=domain_el)
+            if domain not in group.domains:
+                group.domains.append(domain)
+            domains.append({'id': domain.id, 'domain': domain_el, 'created': _domain_created})
+        session.commit()
+        return {
+            'id': group.id,
+            'name': group.name,
+            'domains': domains,
+            'created': _created
+        }
 
     async def post(self, request):
         data = await request.json()
-        group, _created = get_or_create(session, DomainGroup, name=data['name'])
-        domains = []
-        if data.get('domains'):
-            for domain_el in data.get('domains'):
-                domain, _domain_created = get_or_create(session, Domain, domain=domain_el)
-                domains.append({'id': domain.id, 'domain': domain_el, 'created': _domain_created})
+        try:
+            group = await run_db(self.create_group, data['name'], data.get('domains') or [])
+        except (KeyError, ValidationFailure) as exc:
+            raise HTTPBadRequest(text=str(exc))
 
-        return Response(
-            status=200,
-            body=self.resource.encode({
-                'id': group.id,
-                'name': group.name,
-                'domains': domains,
-                'created': _created
-            }), content_type='application/json')
+        return Response(status=200, body=self.resource.encode(group), content_type='application/json')
 
 
 class RestResource:
@@ -119,8 +200,8 @@ class RestResource:
         self.domain_groups_endpoint = DomainGroupEndpoint(self)
 
     def register(self, router: UrlDispatcher):
-        router.add_route('*', '/{domains}'.format(notes=self.notes), self.domain_endpoint.dispatch)
-        router.add_route('*', '/{domain_groups}'.format(notes=self.notes), self.domain_groups_endpoint.dispatch)
+        router.add_route('*', '/domains', self.domain_endpoint.dispatch)
+        router.add_route('*', '/domain_groups', self.domain_groups_endpoint.dispatch)
 
     def render(self, instance):
         return OrderedDict((notes, getattr(instance, notes)) for notes in self.properties)
@@ -130,4 +211,447 @@ class RestResource:
         return json.dumps(data, indent=4).encode('utf-8')
 
     def render_and_encode(self, instance):
-        return self.encode(self.render(instance))
\ No newline at end of file
+        return self.encode(self.render(instance))
+
+
+class SitemapStore:
+    """
+    Published sitemaps, one directory per domain under publish_dir. Every
+    file which is not compressed gets a gzip copy next to it, sent to
+    clients accepting gzip.
+
+    aiohttp derives the ETag of a file from its modification time and
+    size, so files with the same entries as the published ones are left
+    untouched and clients polling them keep getting 304 Not Modified.
+    """
+
+    # lastmod of a sitemap index entry is the time the index was written
+    index_lastmod = re.compile(rb'<lastmod>[^<]*</lastmod>')
+
+    def __init__(self, publish_dir, compresslevel=9):
+        """
+        :param publish_dir: directory of the published sitemaps
+        :param compresslevel: gzip compression level of the compressed copies
+        """
+        self.publish_dir = publish_dir
+        self.compresslevel = compresslevel
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def key(domain):
+        return domain.replace(':', '_')
+
+    def directory(self, domain):
+        """
+        :return: directory of the published sitemap of domain
+        :raise ValueError: if it is not inside publish_dir
+        """
+        directory = os.path.join(self.publish_dir, self.key(domain))
+        if domain.startswith('.') or os.path.realpath(directory) == os.path.realpath(self.publish_dir) or \
+                not resolves_inside(directory, self.publish_dir):
+            raise ValueError('{!r} is outside of {}'.format(domain, self.publish_dir))
+        return directory
+
+    def path(self, domain, name):
+        if name.startswith('.') or name.endswith('.tmp'):
+            raise HTTPNotFound()
+        try:
+            directory = self.directory(domain)
+        except ValueError:
+            raise HTTPNotFound()
+        path = os.path.join(directory, name)
+        if not resolves_inside(path, directory):
+            raise HTTPNotFound()
+        return path
+
+    async def publish(self, domain, filenames):
+        """
+        Replace the published sitemap of domain with filenames
+        :param filenames: files of a finished sitemap, the sitemap index last
+        """
+        async with self.lock:
+            await asyncio.get_event_loop().run_in_executor(None, self.install, domain, filenames)
+
+    def created_names(self, domain):
+        """
+        :return: regular expression of the file names written for domain: its
+            sitemap, shards and sitemap index, their gzip copies and temporary files
+        """
+        return re.compile(r'{}(-(\d+|index))?\.(xml|txt)(\.gz)?(\.tmp)?$'.format(re.escape(self.key(domain))))
+
+    def install(self, domain, filenames):
+        directory = self.directory(domain)
+        os.makedirs(directory, exist_ok=True)
+        names = set()
+        changed = False
+        # Shards are replaced before the sitemap index which references them
+        for number, filename in enumerate(filenames, 1):
+            name = os.path.basename(filename)
+            target = os.path.join(directory, name)
+            names.add(name)
+            # The index only differs by its lastmod values while no shard
+            # changed; once one did, the new lastmod must be published
+            ignore = self.index_lastmod if number == len(filenames) > 1 and not changed else None
+            unchanged = os.path.exists(target) and self.digest(filename, ignore) == self.digest(target, ignore)
+            changed = changed or not unchanged
+            if not name.endswith('.gz'):
+                names.add(name + '.gz')
+                if not unchanged or not os.path.exists(target + '.gz'):
+                    self.compress(filename, target + '.gz')
+            if not unchanged:
+                shutil.copyfile(filename, target + '.tmp')
+                os.replace(target + '.tmp', target)
+        # Shards of a previous, longer sitemap; files this store did not
+        # write are never touched
+        created = self.created_names(domain)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in names and created.match(name) and os.path.isfile(path) and not os.path.islink(path):
+                os.remove(path)
+
+    @staticmethod
+    def digest(filename, ignore=None):
+        """
+        Digest of the lines of filename regardless of their order, which
+        differs from crawl to crawl
+        :param ignore: regular expression of line parts left out
+        """
+        total = count = 0
+        with (gzip.open if filename.endswith('.gz') else open)(filename, 'rb') as file:
+            for line in file:
+                if ignore is not None:
+                    line = ignore.sub(b'', line)
+                total += int.from_bytes(hashlib.blake2b(line, digest_size=16).digest(), 'big')
+                count += 1
+        return total % (1 << 128), count
+
+    def compress(self, filename, target):
+        # mtime=0 makes the output depend on the content only
+        with open(filename, 'rb') as src, open(target + '.tmp', 'wb') as raw:
+            with gzip.GzipFile(filename='', mode='wb', compresslevel=self.compresslevel, fileobj=raw,
+                               mtime=0) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(target + '.tmp', target)
+
+
+class CrawlJob:
+    """
+    Crawl of a list of domains running as a background task of the server.
+    Sitemaps of the domains crawled without error are published to the
+    sitemap store when the job finishes
+    """
+
+    def __init__(self, domains, out_dir, options, sitemaps=None):
+        self.id = uuid.uuid4().hex
+        self.domains = domains
+        self.out_dir = os.path.join(out_dir, self.id)
+        self.options = options
+        self.sitemaps = sitemaps
+        self.published = {}
+        self.status = 'pending'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.errors = {}
+        self.batch = None
+        self.task = None
+
+    def start(self):
+        """
+        :raise TypeError, KeyError, IndexError, ValueError, re.error: if an option value is invalid
+        """
+        # Invalid options fail here, before the job leaves a directory behind
+        self.batch = BatchCrawler(self.domains, self.out_dir, **self.options)
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        self.status = 'running'
+        self.started = time.time()
+        try:
+            results = await self.batch.run()
+            self.errors = {domain: repr(error) for domain, error in results.items() if error is not None}
+            if self.status == 'cancelling':
+                self.status = 'cancelled'
+            else:
+                if self.sitemaps is not None:
+                    await self.publish()
+                self.status = 'failed' if len(self.errors) == len(self.domains) else 'finished'
+        except Exception as exc:
+            self.errors = {'': repr(exc)}
+            self.status = 'failed'
+        finally:
+            self.finished = time.time()
+
+    async def publish(self):
+        for domain, crawler in self.batch.crawlers.items():
+            if domain in self.errors:
+                continue
+            # A crawl which could not even fetch the root url (DNS outage,
+            # site down) must not replace a good published sitemap
+            record = crawler.done.get(crawler.rooturl)
+            if record is None or not record.ok:
+                self.errors[domain] = 'root url {} failed, sitemap not published'.format(crawler.rooturl)
+                continue
+            filenames = crawler.writer.filenames
+            await self.sitemaps.publish(domain, filenames)
+            self.published[domain] = '/sitemaps/{}/{}'.format(domain, os.path.basename(filenames[-1]))
+
+    def cancel(self):
+        if self.status in ('pending', 'running'):
+            self.status = 'cancelling'
+            self.batch.stop()
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def progress(self):
+        return {
+            domain: {
+                'done': len(crawler.done),
+                'queued': crawler.queue.qsize(),
+                'busy': len(crawler.busy),
+            } for domain, crawler in self.batch.crawlers.items()
+        }
+
+    def to_json(self):
+        return {
+            'id': self.id, 'status': self.status, 'domains': self.domains,
+            'created': self.created, 'started': self.started, 'finished': self.finished,
+            'errors': self.errors, 'progress': self.progress(),
+        }
+
+    def result(self):
+        sitemaps = {}
+        for domain, crawler in self.batch.crawlers.items():
+            sitemaps[domain] = {
+                'file': crawler.writer.filename,
+                'exists': os.path.exists(crawler.writer.filename),
+                'urls': len(crawler.done),
+                'ok': sum(record.ok for record in crawler.done.values()),
+                'error': self.errors.get(domain),
+                'published': self.published.get(domain),
+            }
+        return {'id': self.id, 'status': self.status, 'sitemaps': sitemaps}
+
+
+class CrawlJobs:
+    """
+    Crawl jobs of the server. Finished jobs past max_finished are forgotten,
+    oldest first
+    """
+
+    def __init__(self, out_dir, max_finished=1000, defaults=None, sitemaps=None, public_url=None):
+        """
+        :param out_dir: directory of the job outputs, one subdirectory per job
+        :param max_finished: count of finished jobs kept for status and result requests
+        :param defaults: default crawl options of jobs
+        :param sitemaps: SitemapStore the sitemaps of finished jobs are published to
+        :param public_url: url of the server as seen by its clients, used in sitemap indexes of published
+            sitemaps. Default the url of the request submitting the job
+        """
+        self.out_dir = out_dir
+        self.max_finished = max_finished
+        self.defaults = defaults or {}
+        self.sitemaps = sitemaps
+        self.public_url = public_url
+        self.jobs = OrderedDict()
+
+    def submit(self, domains, options, request_url=None):
+        """
+        :param request_url: url of the request submitting the job
+        """
+        options = dict(self.defaults, **options)
+        public_url = self.public_url or request_url
+        if self.sitemaps is not None and public_url and not options.get('sitemap_base_url'):
+            # Sitemap indexes point at the shards where they are published
+            options['sitemap_base_url'] = urllib.parse.urljoin(public_url, '/sitemaps/{domain}/')
+        job = CrawlJob(domains, self.out_dir, options, self.sitemaps)
+        job.start()
+        self.jobs[job.id] = job
+        self.prune()
+        return job
+
+    def prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPNotFound(text='no job {}'.format(job_id))
+        return job
+
+    async def close(self):
+        """
+        Stop running jobs, e.g. on server shutdown
+        """
+        for job in self.jobs.values():
+            job.cancel()
+        await asyncio.gather(*(job.task for job in self.jobs.values() if job.task), return_exceptions=True)
+
+
+class CrawlJobsEndpoint(RestEndpoint):
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+
+    @staticmethod
+    def group_domains(group_id=None, name=None):
+        if group_id is not None:
+            group = session.get(DomainGroup, group_id, options=[selectinload(DomainGroup.domains)])
+        else:
+            group = (session.query(DomainGroup).options(selectinload(DomainGroup.domains))
+                     .filter_by(name=name).first())
+        return None if group is None else [domain.domain for domain in group.domains]
+
+    async def get(self, request) -> Response:
+        offset, limit = page_params(request)
+        jobs = [job.to_json() for job in list(self.jobs.jobs.values())[offset:offset + limit + 1]]
+        data = page(jobs, offset, limit)
+        data['jobs'] = data.pop('items')
+        return Response(status=200, body=RestResource.encode(data), content_type='application/json')
+
+    async def post(self, request):
+        """
+        Submit crawl of {"domains": [...]}, {"group": name} or {"group_id": id},
+        with crawl options in "options"
+        """
+        try:
+            data = await request.json()
+        except ValueError:
+            raise HTTPBadRequest(text='request body must be a JSON object')
+        if not isinstance(data, dict):
+            raise HTTPBadRequest(text='request body must be a JSON object')
+        if data.get('domains'):
+            if not isinstance(data['domains'], list):
+                raise HTTPBadRequest(text='domains must be a list')
+            domains = list(data['domains'])
+        elif data.get('group_id') is not None or data.get('group'):
+            domains = await run_db(self.group_domains, data.get('group_id'), data.get('group'))
+            if domains is None:
+                raise HTTPNotFound(text='no such domain group')
+        else:
+            raise HTTPBadRequest(text='domains, group or group_id required')
+        if not domains:
+            raise HTTPBadRequest(text='no domains to crawl')
+        for domain in domains:
+            # Domains name the sitemap files of the job, never let a path through
+            if not isinstance(domain, str) or not domain_validator(domain, raise_errors=False):
+                raise HTTPBadRequest(text='{!r} is not valid domain'.format(domain))
+
+        options = data.get('options') or {}
+        if not isinstance(options, dict):
+            raise HTTPBadRequest(text='options must be a JSON object')
+        unknown = set(options) - set(JOB_OPTIONS)
+        if unknown:
+            raise HTTPBadRequest(text='unknown options: {}'.format(', '.join(sorted(unknown))))
+
+        try:
+            job = self.jobs.submit(domains, options, str(request.url.origin()))
+        except (TypeError, KeyError, IndexError, ValueError, re.error) as exc:
+            # Option values are checked when the crawlers of the job are built
+            raise HTTPBadRequest(text='invalid options: {!r}'.format(exc))
+        return Response(status=202, body=RestResource.encode(job.to_json()), content_type='application/json')
+
+
+class CrawlJobEndpoint(RestEndpoint):
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+
+    async def get(self, job_id) -> Response:
+        job = self.jobs.get(job_id)
+        return Response(status=200, body=RestResource.encode(job.to_json()), content_type='application/json')
+
+    async def delete(self, job_id) -> Response:
+        job = self.jobs.get(job_id)
+        job.cancel()
+        return Response(status=202, body=RestResource.encode(job.to_json()), content_type='application/json')
+
+
+class CrawlJobResultEndpoint(RestEndpoint):
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+
+    async def get(self, job_id) -> Response:
+        job = self.jobs.get(job_id)
+        if not job.done:
+            raise HTTPConflict(text='job {} is {}'.format(job_id, job.status))
+        return Response(status=200, body=RestResource.encode(job.result()), content_type='application/json')
+
+
+class SitemapEndpoint(RestEndpoint):
+    """
+    Published sitemap files. FileResponse sends them with sendfile and
+    answers conditional (If-None-Match, If-Modified-Since) and Range
+    requests; the gzip copy is sent when the client accepts gzip
+    """
+
+    def __init__(self, sitemaps):
+        super().__init__()
+        self.sitemaps = sitemaps
+        self.register_method('HEAD', self.get)
+
+    async def get(self, domain, name):
+        path = self.sitemaps.path(domain, name)
+        headers = {}
+        if os.path.exists(path + '.gz'):
+            # The response depends on Accept-Encoding even when sent uncompressed
+            headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+        return web.FileResponse(path, headers=headers)
+
+
+class MetricsEndpoint(RestEndpoint):
+    """
+    Metrics of the running crawl jobs in Prometheus text format, labelled
+    by job and domain
+    """
+
+    def __init__(self, jobs):
+        super().__init__()
+        self.jobs = jobs
+        self.metrics = Metrics()
+        self.metrics.gauge('jobs_running', lambda: sum(job.status == 'running' for job in jobs.jobs.values()))
+
+    async def get(self, request) -> Response:
+        sources = [({}, self.metrics)]
+        for job in list(self.jobs.jobs.values()):
+            if job.status == 'running':
+                sources.extend(job.batch.metric_sources({'job': job.id}))
+        return Response(status=200, body=render(sources).encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+def create_app(out_dir='sitemaps', job_defaults=None, max_finished_jobs=1000, publish_dir=None, public_url=None):
+    """
+    REST server application: domains, domain groups, crawl jobs and their
+    published sitemaps, served at /sitemaps/{domain}/{file}, and metrics of
+    the running jobs at /metrics
+    :param out_dir: directory of crawl job outputs
+    :param job_defaults: default crawl options of jobs
+    :param max_finished_jobs: count of finished jobs kept
+    :param publish_dir: directory of the published sitemaps. Default out_dir/published
+    :param public_url: url of the server as seen by its clients (e.g. behind a proxy), used in the sitemap
+        indexes of published sitemaps. Default the url of the request submitting a job
+    """
+    app = web.Application()
+    sitemaps = SitemapStore(publish_dir or os.path.join(out_dir, 'published'))
+    jobs = CrawlJobs(out_dir, max_finished=max_finished_jobs, defaults=job_defaults, sitemaps=sitemaps,
+                     public_url=public_url)
+
+    resource = RestResource('domains', Domain, {}, ('id', 'domain'), 'id')
+    resource.register(app.router)
+    app.router.add_route('*', '/jobs', CrawlJobsEndpoint(jobs).dispatch)
+    app.router.add_route('*', '/jobs/{job_id}', CrawlJobEndpoint(jobs).dispatch)
+    app.router.add_route('*', '/jobs/{job_id}/result', CrawlJobResultEndpoint(jobs).dispatch)
+    app.router.add_route('*', '/sitemaps/{domain}/{name}', SitemapEndpoint(sitemaps).dispatch)
+    app.router.add_route('*', '/metrics', MetricsEndpoint(jobs).dispatch)
+
+    async def close_jobs(app):
+        await jobs.close()
+
+    app.on_shutdown.append(close_jobs)
+    return app
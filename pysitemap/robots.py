@@ -0,0 +1,145 @@
+import asyncio
+import re
+import urllib.parse
+from urllib.robotparser import RobotFileParser
+
+
+class RobotsRules(object):
+    """
+    Allow and Disallow lines of one robots.txt group compiled into a single
+    regular expression, with * and $ wildcards.
+
+    Rules are ordered longest first, Allow before Disallow, so the first
+    alternative matching a path is the rule which applies, as the longest
+    match of RFC 9309.
+    """
+
+    def __init__(self, rules=(), delay=None):
+        """
+        :param rules: (path, allowance) pairs, paths quoted as by urllib.robotparser
+        :type rules: list
+        :param delay: seconds between two requests asked with Crawl-delay or Request-rate
+        :type delay: float
+        """
+        rules = sorted(((path, allowance) for path, allowance in rules if path),
+                       key=lambda rule: (-len(rule[0]), not rule[1]))
+        self.allowances = [allowance for _path, allowance in rules]
+        self.pattern = None
+        if rules:
+            self.pattern = re.compile('|'.join('({})'.format(self.translate(path)) for path, _allowance in rules))
+        self.delay = delay
+
+    @staticmethod
+    def translate(path):
+        # robotparser quotes rule paths, wildcards arrive as %2A and %24
+        end = path.endswith('%24')
+        if end:
+            path = path[:-3]
+        pattern = '.*'.join(re.escape(part) for part in path.split('%2A'))
+        return pattern + '$' if end else pattern
+
+    @staticmethod
+    def quote_path(url):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return urllib.parse.quote(urllib.parse.unquote(path))
+
+    def allowed(self, url):
+        if self.pattern is None:
+            return True
+        match = self.pattern.match(self.quote_path(url))
+        return match is None or self.allowances[match.lastindex - 1]
+
+
+class RobotsCache(object):
+    """
+    robots.txt files of the crawled hosts, fetched once per host and kept
+    parsed for the whole crawl.
+
+    As in urllib.robotparser, 401 and 403 disallow everything and other
+    4xx statuses allow everything. Server errors and failed requests
+    allow everything too, so a flaky robots.txt does not stop the crawl.
+    """
+
+    # robots.txt bytes read at most, RFC 9309 parsers must read 500 KiB
+    max_size = 512 * 1024
+
+    def __init__(self, fetcher):
+        """
+        :param fetcher: Fetcher used to request robots.txt files
+        :type fetcher: pysitemap.fetcher.Fetcher
+        """
+        self.fetcher = fetcher
+        self.parsers = {}
+        self.pending = {}
+        self.compiled = {}
+
+    @staticmethod
+    def robots_url(url):
+        parts = urllib.parse.urlsplit(url)
+        return urllib.parse.urlunsplit((parts.scheme, parts.netloc, '/robots.txt', '', ''))
+
+    async def get(self, url):
+        """
+        :return: parsed robots.txt of the host of url
+        :rtype: RobotFileParser
+        """
+        robots_url = self.robots_url(url)
+        parser = self.parsers.get(robots_url)
+        if parser is not None:
+            return parser
+        # Concurrent callers wait for the same request
+        if robots_url not in self.pending:
+            self.pending[robots_url] = asyncio.ensure_future(self.fetch(robots_url))
+        return await asyncio.shield(self.pending[robots_url])
+
+    async def fetch(self, robots_url):
+        parser = RobotFileParser(robots_url)
+        try:
+            async with self.fetcher.request('GET', robots_url) as resp:
+                if resp.status in (401, 403):
+                    parser.disallow_all = True
+                elif resp.status >= 400:
+                    parser.allow_all = True
+                else:
+                    body = await resp.content.read(self.max_size)
+                    parser.parse(body.decode('utf-8', 'replace').splitlines())
+        except Exception as exc:
+            print('...', robots_url, 'has error', repr(str(exc)))
+            parser.allow_all = True
+        self.parsers[robots_url] = parser
+        self.pending.pop(robots_url, None)
+        return parser
+
+    async def rules(self, url, user_agent='*'):
+        """
+        :return: compiled rules of the robots.txt group for user_agent on the host of url
+        :rtype: RobotsRules
+        """
+        key = (self.robots_url(url), user_agent)
+        if key not in self.compiled:
+            parser = await self.get(url)
+            if parser.disallow_all:
+                rules = RobotsRules([('/', False)])
+            elif parser.allow_all:
+                rules = RobotsRules()
+            else:
+                entry = next((entry for entry in parser.entries if entry.applies_to(user_agent)),
+                             parser.default_entry)
+                rules = RobotsRules()
+                if entry is not None:
+                    delay = entry.delay
+                    if entry.req_rate and entry.req_rate.requests:
+                        delay = max(delay or 0, entry.req_rate.seconds / entry.req_rate.requests)
+                    rules = RobotsRules([(line.path, line.allowance) for line in entry.rulelines], delay)
+            self.compiled[key] = rules
+        return self.compiled[key]
+
+    async def sitemaps(self, url):
+        """
+        :return: urls of Sitemap lines in robots.txt of the host of url
+        """
+        parser = await self.get(url)
+        return parser.site_maps() or []
@@ -0,0 +1,81 @@
+import re
+from functools import lru_cache
+
+# Numbered or named backreferences, conditionals on groups and named groups
+# change meaning or clash once joined into one regex
+group_reference = re.compile(r'\\[1-9]|\(\?P[=<]|\(\?\(')
+# Global inline flags such as (?i) apply to the whole regex they are in
+# (an error past its start since Python 3.11), scoped ones like (?i:...) don't
+inline_flags = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+class PatternSet:
+    """
+    Set of url regexes compiled once into a single alternation.
+
+    Lookups are memoized per url, so a link seen on many pages is only
+    matched once.
+    """
+
+    def __init__(self, patterns=None, cache_size=65536):
+        """
+        :param patterns: list of url regexes
+        :type patterns: list
+        :param cache_size: max count of memoized urls
+        :type cache_size: int
+        """
+        self.patterns = list(patterns or [])
+        self.regexes = [re.compile(p) for p in self.patterns]
+        # Patterns with group references, named groups or global inline
+        # flags keep a regex of their own, the others are joined
+        joined = [p for p in self.patterns if not (group_reference.search(p) or inline_flags.search(p))]
+        if len(joined) > 1:
+            try:
+                regex = re.compile('|'.join('(?:{})'.format(p) for p in joined))
+            except re.error:
+                # Some other clash of the joined patterns, keep them apart
+                pass
+            else:
+                self.regexes = [regex for p, regex in zip(self.patterns, self.regexes) if p not in joined]
+                self.regexes.append(regex)
+        self.search = lru_cache(maxsize=cache_size)(self._search)
+
+    def _search(self, url):
+        for regex in self.regexes:
+            if regex.search(url):
+                return True
+        return False
+
+    def __contains__(self, url):
+        return self.search(url)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+
+class FirstMatchTable:
+    """
+    Ordered table of (url regex, value) pairs.
+
+    The value of the first regex matching the url is returned, which is
+    the same order the changefreq and priorities dictionaries are given in.
+    """
+
+    def __init__(self, rules=None, cache_size=65536):
+        """
+        :param rules: dictionary, where key is url regex and value is anything
+        :type rules: dict
+        :param cache_size: max count of memoized urls
+        :type cache_size: int
+        """
+        self.rules = [(re.compile(key), value) for key, value in (rules or {}).items()]
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, url):
+        for regex, value in self.rules:
+            if regex.search(url):
+                return value
+        return None
+
+    def __bool__(self):
+        return bool(self.rules)
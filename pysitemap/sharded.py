@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import multiprocessing
+import queue
+import signal
+import urllib.parse
+
+from pysitemap.base_crawler import Crawler
+from pysitemap.backends.done import DoneRecord
+
+
+def shard_of(url, shards):
+    """
+    Stable shard number of url, from a hash of its host and path. The same
+    url maps to the same shard in every process and every run
+    """
+    parts = urllib.parse.urlsplit(url)
+    digest = hashlib.blake2b((parts.netloc + parts.path).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+class ShardCrawler(Crawler):
+    """
+    Crawler of one shard of the url space in a multi-process crawl.
+
+    Urls of other shards are collected in an outbox and sent to the inbox
+    queues of their owners in batches. The crawler reports whether it is
+    idle with its counts of sent and received urls, and runs until the
+    coordinator tells every shard that the crawl is complete.
+    """
+
+    # seconds between outbox flushes and status reports
+    report_interval = 0.05
+    # urls per result message sent to the coordinator
+    result_batch_size = 1000
+
+    def __init__(self, shard, inboxes, reports, results, *args, **kwargs):
+        """
+        :param shard: number of this shard
+        :type shard: int
+        :param inboxes: multiprocessing queues of url batches, one per shard
+        :type inboxes: list
+        :param reports: queue of (shard, idle, sent, received) status reports to the coordinator
+        :param results: queue of done records to the coordinator
+        """
+        super().__init__(*args, **kwargs)
+        self.shard = shard
+        self.inboxes = inboxes
+        self.reports = reports
+        self.results = results
+        self.outbox = {}
+        self.sent = 0
+        self.received = 0
+        self.finished = False
+        # The coordinator writes the output
+        self.stream_output = False
+        # Politeness delays hold for the site, not for each process
+        self.fetcher.delay *= len(inboxes)
+        if shard != 0:
+            self.seed_sitemaps = False
+        if self.metrics_port is not None:
+            self.metrics_port += shard
+
+    def progress(self):
+        return 'shard {}: {}'.format(self.shard, super().progress())
+
+    async def loadrobots(self):
+        await super().loadrobots()
+        if self.robots_rules.delay:
+            host = urllib.parse.urlsplit(self.rooturl).netloc
+            self.fetcher.host_delays[host] = max(self.fetcher.delay, self.robots_rules.delay * len(self.inboxes))
+
+    async def addurls(self, urls):
+        local = []
+        for url, parenturl in urls:
+            url = urllib.parse.urljoin(parenturl, url)
+            url, frag = urllib.parse.urldefrag(url)
+            shard = shard_of(url, len(self.inboxes))
+            if shard == self.shard:
+                local.append((url, ''))
+            elif url.startswith(self.rooturl) and url not in self.seen:
+                # The owner checks exclusions and robots.txt, seen only
+                # keeps the url from being sent again
+                self.seen.add(url)
+                self.outbox.setdefault(shard, []).append(url)
+        await super().addurls(local)
+
+    def flush(self):
+        for shard, urls in self.outbox.items():
+            self.inboxes[shard].put(urls)
+            self.sent += len(urls)
+        self.outbox = {}
+
+    async def receive(self):
+        """
+        Queue urls sent by other shards until the coordinator ends the crawl
+        """
+        loop = asyncio.get_event_loop()
+        inbox = self.inboxes[self.shard]
+        while True:
+            try:
+                urls = await loop.run_in_executor(None, inbox.get, True, 0.5)
+            except queue.Empty:
+                continue
+            if urls is None:
+                self.finished = True
+                return
+            self.received += len(urls)
+            await super().addurls([(url, '') for url in urls])
+
+    async def drain(self):
+        receiver = asyncio.ensure_future(self.receive())
+        try:
+            if self.seed_sitemaps:
+                await self.seed()
+            while not self.finished:
+                self.flush()
+                idle = self.queue.empty() and not self.busy and not self.outbox
+                self.reports.put((self.shard, idle, self.sent, self.received))
+                await asyncio.sleep(self.report_interval)
+        finally:
+            receiver.cancel()
+
+    async def save(self):
+        """
+        Send done records to the coordinator, which writes the sitemap
+        """
+        batch = []
+        for url, record in self.done.items():
+            batch.append((url, record.to_row()))
+            if len(batch) >= self.result_batch_size:
+                self.results.put(batch)
+                batch = []
+        if batch:
+            self.results.put(batch)
+        self.results.put({'probe_bytes_saved': self.probe_bytes_saved})
+
+
+def run_shard(shard, inboxes, reports, results, args, kwargs):
+    # The coordinator handles SIGINT for the whole crawl
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    crawler = ShardCrawler(shard, inboxes, reports, results, *args, **kwargs)
+    asyncio.run(crawler.run())
+
+
+class Coordinator(object):
+    """
+    Multi-process crawl: the url space is partitioned by shard_of() across
+    processes, each running a ShardCrawler with its own event loop and
+    connections. The coordinator detects global completion and writes the
+    results of all shards with a single writer.
+
+    The crawl is complete when every shard is idle, all urls sent between
+    shards were received, and no shard changed on its next report.
+    """
+
+    # seconds to wait for a message before checking the shard processes
+    poll_interval = 1.0
+
+    def __init__(self, processes, *args, **kwargs):
+        """
+        :param processes: count of shard processes
+        :type processes: int
+        :param args: Crawler arguments
+        :param kwargs: Crawler keyword arguments
+        """
+        if kwargs.get('state_file'):
+            raise ValueError('state_file is not supported by multi-process crawls')
+        self.processes = processes
+        self.args = args
+        self.kwargs = kwargs
+        # Crawler of the main process only collects results and writes them
+        self.crawler = Crawler(*args, **kwargs)
+        self.probe_bytes_saved = 0
+
+    def receive(self, channel, workers, finishing=False):
+        """
+        Next message of channel
+        :param finishing: shards were told to finish, and may have exited
+        :raise RuntimeError: if a shard process died
+        """
+        while True:
+            # Checked before every message, the other shards keep reporting
+            # while one of them is dead
+            for shard, worker in enumerate(workers):
+                if worker.exitcode is not None and (worker.exitcode != 0 or not finishing):
+                    raise RuntimeError('shard {} exited with code {}'.format(shard, worker.exitcode))
+            try:
+                return channel.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if finishing and not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError('shards exited without sending all results')
+
+    def wait(self, reports, workers):
+        """
+        Read status reports until the crawl is complete
+        """
+        latest = {}
+        candidate = None
+        fresh = set()
+        while True:
+            shard, idle, sent, received = self.receive(reports, workers)
+            latest[shard] = (idle, sent, received)
+            fresh.add(shard)
+            if len(latest) < self.processes or not all(status[0] for status in latest.values()):
+                candidate = None
+                continue
+            if sum(status[1] for status in latest.values()) != sum(status[2] for status in latest.values()):
+                candidate = None
+                continue
+            snapshot = sorted(latest.items())
+            if snapshot != candidate:
+                candidate = snapshot
+                fresh = set()
+            elif len(fresh) == self.processes:
+                # Every shard reported again without any change
+                return
+
+    def collect(self, results, workers):
+        finished = 0
+        while finished < self.processes:
+            message = self.receive(results, workers, finishing=True)
+            if isinstance(message, dict):
+                self.probe_bytes_saved += message['probe_bytes_saved']
+                finished += 1
+                continue
+            for url, row in message:
+                record = DoneRecord.from_row(*row)
+                if record.images:
+                    # Shards list their images independently, keep each
+                    # image on the first page collected
+                    images = [image for image in record.images if self.crawler.done_images.add(url, image)]
+                    record = DoneRecord(record.ok, record.lastmod, record.changefreq, record.priority, images)
+                self.crawler.done[url] = record
+        self.crawler.done_images.flush()
+
+    def run(self):
+        """
+        :return: True if the crawl completed, False if it was stopped
+        :raise RuntimeError: if a shard process died, the others are stopped
+        """
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(self.processes)]
+        reports = context.Queue()
+        results = context.Queue()
+        workers = [context.Process(target=run_shard, args=(shard, inboxes, reports, results, self.args, self.kwargs))
+                   for shard in range(self.processes)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            self.wait(reports, workers)
+            for inbox in inboxes:
+                inbox.put(None)
+            # Results are read before joining, a process exits only once its
+            # queued messages are consumed
+            self.collect(results, workers)
+        except KeyboardInterrupt:
+            self.terminate(workers)
+            print('crawl stopped')
+            return False
+        except RuntimeError:
+            self.terminate(workers)
+            raise
+        for worker in workers:
+            worker.join()
+
+        asyncio.run(self.crawler.writer.write(self.crawler.output_entries(), self.crawler.timezone_offset))
+        return True
+
+    @staticmethod
+    def terminate(workers):
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,18 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--runslow', action='store_true', default=False, help='run slow tests')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: slow test, run with --runslow')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--runslow'):
+        return
+    skip_slow = pytest.mark.skip(reason='needs --runslow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip_slow)
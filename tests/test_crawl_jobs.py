@@ -0,0 +1,53 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+
+@pytest.fixture
+def rest(tmp_path, monkeypatch):
+    # pysitemap.rest creates the domain database in the working directory
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('pysitemap.rest')
+
+
+def post_jobs(rest, out_dir, bodies):
+    """
+    :param bodies: request bodies, dictionaries are sent as JSON
+    :return: (status, text) of every response
+    """
+    async def main():
+        async with TestClient(TestServer(rest.create_app(out_dir=out_dir))) as client:
+            responses = []
+            for body in bodies:
+                if isinstance(body, dict):
+                    resp = await client.post('/jobs', json=body)
+                else:
+                    resp = await client.post('/jobs', data=body, headers={'Content-Type': 'application/json'})
+                responses.append((resp.status, await resp.text()))
+            return responses
+
+    return asyncio.run(main())
+
+
+def test_invalid_requests(rest, tmp_path):
+    out_dir = str(tmp_path / 'jobs')
+    responses = post_jobs(rest, out_dir, [
+        b'{not json',
+        b'[]',
+        {},
+        {'domains': 'example.com'},
+        {'domains': ['../etc']},
+        {'domains': ['example.com'], 'options': {'unknown': 1}},
+        {'domains': ['example.com'], 'options': ['out_format']},
+        {'domains': ['example.com'], 'options': {'out_format': 'html'}},
+        {'domains': ['example.com'], 'options': {'sitemap_base_url': 'https://x/{dom}/'}},
+        {'domains': ['example.com'], 'options': {'exclude_urls': ['(']}},
+        {'domains': ['example.com'], 'options': {'exclude_urls': 5}},
+    ])
+    assert [status for status, _text in responses] == [400] * 11
+    assert 'html' in responses[7][1]
+    # Rejected jobs leave nothing behind
+    assert not os.path.exists(out_dir) or os.listdir(out_dir) == []
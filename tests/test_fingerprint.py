@@ -0,0 +1,128 @@
+import pytest
+
+from pysitemap.backends.fingerprint import DELETED, EMPTY, BloomFilter, FingerprintSet, fingerprint
+
+
+def urls(count, prefix='https://example.com/page/'):
+    return ['{}{}'.format(prefix, i) for i in range(count)]
+
+
+def test_fingerprint_is_not_a_slot_marker():
+    for url in urls(10000):
+        assert fingerprint(url) > DELETED
+    assert fingerprint('https://example.com/') == fingerprint('https://example.com/')
+
+
+def test_add_contains():
+    seen = FingerprintSet()
+    seen.add('https://example.com/a')
+    seen.add('https://example.com/a')
+    assert 'https://example.com/a' in seen
+    assert 'https://example.com/b' not in seen
+    assert len(seen) == 1
+
+
+def test_remove_discard():
+    seen = FingerprintSet()
+    seen.add('https://example.com/a')
+    seen.remove('https://example.com/a')
+    assert 'https://example.com/a' not in seen
+    assert len(seen) == 0
+    with pytest.raises(KeyError):
+        seen.remove('https://example.com/a')
+    seen.discard('https://example.com/a')
+    assert len(seen) == 0
+
+
+def test_grow():
+    seen = FingerprintSet(capacity=8)
+    size = len(seen.table)
+    added = urls(5000)
+    for url in added:
+        seen.add(url)
+    assert len(seen) == 5000
+    assert len(seen.table) > size
+    assert len(seen.table) & (len(seen.table) - 1) == 0
+    assert seen.used <= seen.max_load * len(seen.table)
+    assert all(url in seen for url in added)
+    assert not any(url in seen for url in urls(5000, 'https://example.com/other/'))
+
+
+def test_tombstones():
+    # A full small table: lookups probe past the removed slots
+    seen = FingerprintSet(capacity=8, max_load=0.9)
+    added = urls(12)
+    for url in added:
+        seen.add(url)
+    used = seen.used
+    for url in added[::2]:
+        seen.remove(url)
+    assert seen.table.count(DELETED) == 6
+    assert seen.used == used
+    assert all(url in seen for url in added[1::2])
+    assert not any(url in seen for url in added[::2])
+
+    # Removed slots are reused
+    for url in added[::2]:
+        seen.add(url)
+    assert seen.used == used
+    assert len(seen) == 12
+    assert all(url in seen for url in added)
+
+
+def test_grow_drops_tombstones():
+    seen = FingerprintSet(capacity=8)
+    added = urls(100)
+    for url in added:
+        seen.add(url)
+        seen.remove(url)
+    seen.add('https://example.com/kept')
+    assert len(seen) == 1
+    assert seen.table.count(DELETED) < 100
+    assert seen.used == len(seen.table) - seen.table.count(EMPTY)
+    assert 'https://example.com/kept' in seen
+    assert not any(url in seen for url in added)
+
+
+def test_bloom_front():
+    seen = FingerprintSet(bloom_capacity=1000)
+    added = urls(1000)
+    for url in added:
+        seen.add(url)
+    # The filter only answers "not seen", membership stays exact
+    assert all(url in seen for url in added)
+    assert not any(url in seen for url in urls(1000, 'https://example.com/other/'))
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = urls(1000)
+    for url in added:
+        bloom.add(url)
+        bloom.add(url)
+    assert all(url in bloom for url in added)
+    assert len(bloom) <= 1000
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=100000, error_rate=0.01)
+    for url in urls(100000):
+        bloom.add(url)
+    others = urls(100000, 'https://example.com/other/')
+    false_positives = sum(url in bloom for url in others)
+    assert false_positives / len(others) < 0.015
+
+
+@pytest.mark.slow
+def test_ten_million_urls():
+    count = 10 ** 7
+    seen = FingerprintSet(capacity=count)
+    for i in range(count):
+        seen.add('https://example.com/page/{}'.format(i))
+    # 2^24 slots of 8 bytes
+    assert len(seen.table) == 2 ** 24
+    assert seen.table.itemsize * len(seen.table) == 128 * 1024 * 1024
+    # Fingerprint collisions are expected with probability ~2.7e-6
+    assert len(seen) == count
+    assert all('https://example.com/page/{}'.format(i) in seen for i in range(0, count, 997))
+    assert not any('https://example.com/other/{}'.format(i) in seen for i in range(100000))
@@ -0,0 +1,66 @@
+import sqlite3
+
+from pysitemap.backends.images import ImageRegistry, SQLiteImageRegistry
+
+
+def tag(src, title=None):
+    tag = {'src': src}
+    if title is not None:
+        tag['title'] = title
+    return tag
+
+
+def check_registry(registry):
+    assert registry.add('https://example.com/a', tag('https://example.com/x.png', 'first'))
+    assert not registry.add('https://example.com/b', tag('HTTPS://EXAMPLE.COM/x.png#top', 'second'))
+    assert registry.add('https://example.com/b', tag('https://example.com/y.png'))
+    assert 'https://Example.com/x.png' in registry
+    assert 'https://example.com/z.png' not in registry
+    assert registry.get('https://example.com/x.png') == tag('https://example.com/x.png', 'first')
+    assert registry.pages_of('https://example.com/x.png') == ['https://example.com/a', 'https://example.com/b']
+    assert len(registry) == 2
+    assert sorted(image['src'] for image in registry) == ['https://example.com/x.png', 'https://example.com/y.png']
+
+
+def test_image_registry():
+    check_registry(ImageRegistry())
+
+
+def test_sqlite_image_registry():
+    registry = SQLiteImageRegistry()
+    check_registry(registry)
+    registry.close()
+
+
+def count_images(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('select count(*) from images;').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_flush(tmp_path):
+    path = str(tmp_path / 'images.db')
+    registry = SQLiteImageRegistry(path, batch_size=1000)
+    for i in range(10):
+        registry.add('https://example.com/', tag('https://example.com/{}.png'.format(i)))
+    registry.flush()
+    assert count_images(path) == 10
+    registry.close()
+
+
+def test_reset(tmp_path):
+    path = str(tmp_path / 'images.db')
+    registry = SQLiteImageRegistry(path)
+    registry.add('https://example.com/', tag('https://example.com/a.png'))
+    registry.close()
+    assert count_images(path) == 1
+    # A new crawl lists its images again
+    assert len(SQLiteImageRegistry(path)) == 0
+    registry = SQLiteImageRegistry(path)
+    registry.add('https://example.com/', tag('https://example.com/a.png'))
+    registry.close()
+    registry = SQLiteImageRegistry(path, reset=False)
+    assert 'https://example.com/a.png' in registry
+    registry.close()
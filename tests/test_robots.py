@@ -0,0 +1,140 @@
+import asyncio
+from urllib.robotparser import RobotFileParser
+
+from pysitemap.robots import RobotsCache, RobotsRules
+
+ROBOTS_TXT = """
+User-agent: *
+Disallow: /private/
+Allow: /private/public/
+Disallow: /*.pdf$
+Disallow: /search?*q=
+Crawl-delay: 2
+
+User-agent: slowbot
+Disallow: /
+Request-rate: 1/10
+"""
+
+
+def compile_group(text, user_agent='*'):
+    """
+    RobotsRules of a robots.txt group, as RobotsCache.rules builds them
+    """
+    parser = RobotFileParser()
+    parser.parse(text.splitlines())
+    entry = next((entry for entry in parser.entries if entry.applies_to(user_agent)), parser.default_entry)
+    return RobotsRules([(line.path, line.allowance) for line in entry.rulelines], entry.delay)
+
+
+def test_no_rules_allow_everything():
+    rules = RobotsRules()
+    assert rules.allowed('https://example.com/anything')
+    assert rules.delay is None
+
+
+def test_prefix_rules():
+    rules = compile_group(ROBOTS_TXT)
+    assert rules.allowed('https://example.com/')
+    assert not rules.allowed('https://example.com/private/')
+    assert not rules.allowed('https://example.com/private/page')
+    assert rules.allowed('https://example.com/privateer')
+    assert rules.delay == 2
+
+
+def test_longest_match_wins():
+    rules = compile_group(ROBOTS_TXT)
+    assert rules.allowed('https://example.com/private/public/page')
+    rules = RobotsRules([('/a/', True), ('/a/b/', False)])
+    assert rules.allowed('https://example.com/a/c')
+    assert not rules.allowed('https://example.com/a/b/c')
+
+
+def test_allow_wins_on_equal_length():
+    rules = RobotsRules([('/page', False), ('/page', True)])
+    assert rules.allowed('https://example.com/page')
+
+
+def test_wildcards():
+    rules = compile_group(ROBOTS_TXT)
+    assert not rules.allowed('https://example.com/files/report.pdf')
+    assert rules.allowed('https://example.com/files/report.pdf?download=1')
+    assert rules.allowed('https://example.com/files/report.pdfx')
+    assert not rules.allowed('https://example.com/search?lang=en&q=test')
+    assert rules.allowed('https://example.com/search?lang=en')
+
+
+def test_paths_are_compared_quoted():
+    rules = RobotsRules([('/caf%C3%A9/', False)])
+    assert not rules.allowed('https://example.com/café/menu')
+    assert not rules.allowed('https://example.com/caf%C3%A9/menu')
+    assert not rules.allowed('https://example.com/caf%c3%a9/menu')
+
+
+def test_group_of_user_agent():
+    rules = compile_group(ROBOTS_TXT, 'slowbot')
+    assert not rules.allowed('https://example.com/')
+    assert compile_group(ROBOTS_TXT, 'otherbot').allowed('https://example.com/')
+
+
+class Content:
+
+    def __init__(self, body):
+        self.body = body
+
+    async def read(self, size):
+        return self.body[:size]
+
+
+class Response:
+
+    def __init__(self, status, body):
+        self.status = status
+        self.content = Content(body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class Fetcher:
+    """
+    Answers every request with the same response, counting requests
+    """
+
+    def __init__(self, status=200, body=b''):
+        self.status = status
+        self.body = body
+        self.requests = []
+
+    def request(self, method, url):
+        self.requests.append(url)
+        return Response(self.status, self.body)
+
+
+def cached_rules(fetcher, urls, user_agent='*'):
+    async def main():
+        cache = RobotsCache(fetcher)
+        return [await cache.rules(url, user_agent) for url in urls]
+    return asyncio.run(main())
+
+
+def test_cache_fetches_once_per_host():
+    fetcher = Fetcher(body=ROBOTS_TXT.encode('utf-8'))
+    rules = cached_rules(fetcher, ['https://example.com/a', 'https://example.com/b', 'https://other.example.com/'])
+    assert fetcher.requests == ['https://example.com/robots.txt', 'https://other.example.com/robots.txt']
+    assert rules[0] is rules[1]
+    assert not rules[0].allowed('https://example.com/private/')
+
+
+def test_cache_request_rate_delay():
+    rules, = cached_rules(Fetcher(body=ROBOTS_TXT.encode('utf-8')), ['https://example.com/'], 'slowbot')
+    assert rules.delay == 10
+
+
+def test_cache_status_codes():
+    for status, allowed in ((401, False), (403, False), (404, True), (500, True)):
+        rules, = cached_rules(Fetcher(status, b'User-agent: *\nDisallow: /\n'), ['https://example.com/'])
+        assert rules.allowed('https://example.com/page') is allowed, status
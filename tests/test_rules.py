@@ -0,0 +1,117 @@
+import re
+
+import pytest
+
+from pysitemap.rules import FirstMatchTable, PatternSet
+
+
+def test_pattern_set_matches_any_pattern():
+    patterns = PatternSet([r'\.pdf$', '/admin/', r'\?page=\d+'])
+    assert 'https://example.com/doc.pdf' in patterns
+    assert 'https://example.com/admin/users' in patterns
+    assert 'https://example.com/list?page=2' in patterns
+    assert 'https://example.com/doc.pdf.html' not in patterns
+    assert 'https://example.com/list?page=' not in patterns
+    assert len(patterns.regexes) == 1
+
+
+def test_pattern_set_empty():
+    patterns = PatternSet()
+    assert not patterns
+    assert 'https://example.com/' not in patterns
+    assert PatternSet(['/a'])
+
+
+def test_pattern_set_alternatives_stay_grouped():
+    patterns = PatternSet(['^https://a|b$', '/c'])
+    assert 'https://a.example.com/' in patterns
+    assert 'https://example.com/b' in patterns
+    assert 'https://example.com/c/' in patterns
+    assert 'https://example.com/a' not in patterns
+
+
+def test_pattern_set_global_inline_flags_stay_separate():
+    patterns = PatternSet(['(?i)/ADMIN', '/tmp', '/bar'])
+    assert 'https://example.com/admin' in patterns
+    # (?i) must not apply to the other patterns
+    assert 'https://example.com/TMP' not in patterns
+    assert 'https://example.com/BAR' not in patterns
+    assert 'https://example.com/tmp' in patterns
+    assert [regex.pattern for regex in patterns.regexes] == ['(?i)/ADMIN', '(?:/tmp)|(?:/bar)']
+
+
+def test_pattern_set_scoped_inline_flags_are_joined():
+    patterns = PatternSet(['(?i:/foo)', '/bar'])
+    assert 'https://example.com/FOO' in patterns
+    assert 'https://example.com/BAR' not in patterns
+    assert len(patterns.regexes) == 1
+
+
+def test_pattern_set_backreferences_stay_separate():
+    patterns = PatternSet([r'/(\d)x\1$', r'/(?P<a>\w)-(?P=a)$', '/tmp'])
+    assert 'https://example.com/3x3' in patterns
+    assert 'https://example.com/3x4' not in patterns
+    assert 'https://example.com/q-q' in patterns
+    assert 'https://example.com/q-r' not in patterns
+    assert 'https://example.com/tmp' in patterns
+    assert len(patterns.regexes) == 3
+
+
+def test_pattern_set_named_groups_stay_separate():
+    # The same group name twice is an error in one regex
+    patterns = PatternSet([r'(?P<id>\d+)/edit', r'(?P<id>\d+)/delete', '/tmp', '/bar'])
+    assert 'https://example.com/12/edit' in patterns
+    assert 'https://example.com/12/delete' in patterns
+    assert 'https://example.com/12/view' not in patterns
+    assert 'https://example.com/tmp' in patterns
+    assert len(patterns.regexes) == 3
+
+
+def test_pattern_set_conditionals_stay_separate():
+    # Group numbers shift once joined, (?(1)...) would refer to the group of x(y)
+    patterns = PatternSet(['x(y)', '/(a)?(?(1)b|c)$'])
+    assert 'https://example.com/ab' in patterns
+    assert 'https://example.com/c' in patterns
+    assert 'https://example.com/a' not in patterns
+    assert 'https://example.com/xy' in patterns
+    assert len(patterns.regexes) == 2
+
+
+def test_pattern_set_invalid_pattern():
+    # Only valid joined with a pattern lending it a group 1
+    with pytest.raises(re.error):
+        PatternSet(['a(?(1)b|c)', 'x(y)'])
+
+
+def test_pattern_set_same_result_as_separate_regexes():
+    raw = [r'\.jpe?g$', '/tag/', r'(?i)\.PNG$', r'^https://cdn\.', r'/(\w+)/\1/']
+    patterns = PatternSet(raw)
+    urls = ['https://example.com/a.jpg', 'https://example.com/a.JPG', 'https://example.com/a.png',
+            'https://cdn.example.com/', 'https://example.com/tag/x', 'https://example.com/x/x/',
+            'https://example.com/x/y/', 'https://example.com/']
+    for url in urls:
+        assert (url in patterns) == any(re.search(p, url) for p in raw), url
+
+
+def test_pattern_set_memoizes():
+    patterns = PatternSet(['/a'])
+    assert 'https://example.com/a' in patterns
+    assert 'https://example.com/a' in patterns
+    info = patterns.search.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_first_match_table():
+    table = FirstMatchTable({'/blog/': 'daily', '/blog/archive/': 'never', '': 'monthly'})
+    # The first matching rule wins, in the order of the dictionary
+    assert table.lookup('https://example.com/blog/archive/1') == 'daily'
+    assert table.lookup('https://example.com/about') == 'monthly'
+    assert table
+
+
+def test_first_match_table_no_match():
+    table = FirstMatchTable({r'\.html$': 0.8})
+    assert table.lookup('https://example.com/a.html') == 0.8
+    assert table.lookup('https://example.com/a.pdf') is None
+    assert not FirstMatchTable()
+    assert FirstMatchTable().lookup('https://example.com/') is None
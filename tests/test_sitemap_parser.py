@@ -0,0 +1,110 @@
+import gzip
+
+from pysitemap.parsers import SitemapParser, read_sitemap
+
+URLSET = b"""<?xml version="1.0" encoding="utf-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+<url>
+  <loc> https://example.com/ </loc>
+  <lastmod>2024-01-02T03:04:05+00:00</lastmod>
+  <changefreq>daily</changefreq>
+  <priority>1.0</priority>
+  <image:image>
+    <image:loc>https://example.com/a.png</image:loc>
+    <image:title>A &amp; B</image:title>
+  </image:image>
+  <image:image><image:title>no loc</image:title></image:image>
+</url>
+<url><loc>https://example.com/about?a=1&amp;b=2</loc></url>
+<url><changefreq>never</changefreq></url>
+</urlset>
+"""
+
+INDEX = b"""<?xml version="1.0" encoding="utf-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>https://example.com/sitemap-1.xml</loc></sitemap>
+<sitemap><loc>https://example.com/sitemap-2.txt.gz</loc><lastmod>2024-01-02</lastmod></sitemap>
+</sitemapindex>
+"""
+
+
+def parse(data, chunk_size=None):
+    chunk_size = chunk_size or max(len(data), 1)
+    parser = SitemapParser()
+    entries = []
+    sitemaps = []
+    for i in range(0, len(data), chunk_size):
+        parser.feed(data[i:i + chunk_size])
+        entries += parser.pop_urls()
+        sitemaps += parser.pop_sitemaps()
+    parser.close()
+    return entries + parser.pop_urls(), sitemaps + parser.pop_sitemaps()
+
+
+def test_urlset():
+    entries, sitemaps = parse(URLSET)
+    assert sitemaps == []
+    assert [url for url, _record in entries] == ['https://example.com/', 'https://example.com/about?a=1&b=2']
+    record = entries[0][1]
+    assert record.ok
+    assert record.lastmod == '2024-01-02T03:04:05+00:00'
+    assert record.changefreq == 'daily'
+    assert record.priority == '1.0'
+    assert record.images == ({'src': 'https://example.com/a.png', 'title': 'A & B'},)
+    record = entries[1][1]
+    assert (record.lastmod, record.changefreq, record.priority, record.images) == (None, None, None, ())
+
+
+def test_any_chunk_size():
+    expected = parse(URLSET)
+    for chunk_size in (1, 2, 7, 64):
+        entries, _sitemaps = parse(URLSET, chunk_size)
+        assert [(url, record.images) for url, record in entries] == \
+               [(url, record.images) for url, record in expected[0]]
+
+
+def test_sitemap_index():
+    entries, sitemaps = parse(INDEX, 5)
+    assert entries == []
+    assert sitemaps == ['https://example.com/sitemap-1.xml', 'https://example.com/sitemap-2.txt.gz']
+
+
+def test_text_sitemap():
+    entries, _sitemaps = parse(b'\n https://example.com/\r\nhttps://example.com/a\n\nhttps://example.com/b', 3)
+    assert [url for url, _record in entries] == ['https://example.com/', 'https://example.com/a', 'https://example.com/b']
+    assert all(record.ok for _url, record in entries)
+
+
+def test_gzip():
+    for data in (URLSET, b'https://example.com/\n'):
+        assert [url for url, _ in parse(gzip.compress(data), 1)[0]] == [url for url, _ in parse(data)[0]]
+
+
+def test_empty():
+    assert parse(b'') == ([], [])
+    assert parse(b'\n  \n') == ([], [])
+
+
+def test_elements_are_dropped():
+    parser = SitemapParser()
+    parser.feed(URLSET[:URLSET.index(b'</urlset>')])
+    assert len(parser.pop_urls()) == 2
+    assert len(parser.root) == 0
+
+
+def test_read_sitemap_follows_index(tmp_path):
+    (tmp_path / 'sitemap.xml').write_bytes(INDEX)
+    (tmp_path / 'sitemap-1.xml').write_bytes(URLSET)
+    (tmp_path / 'sitemap-2.txt.gz').write_bytes(gzip.compress(b'https://example.com/c\n'))
+    entries = list(read_sitemap(str(tmp_path / 'sitemap.xml'), chunk_size=16))
+    assert [url for url, _record in entries] == [
+        'https://example.com/', 'https://example.com/about?a=1&b=2', 'https://example.com/c']
+
+
+def test_read_sitemap_missing_shard(tmp_path, capsys):
+    (tmp_path / 'sitemap.xml').write_bytes(INDEX)
+    (tmp_path / 'sitemap-1.xml').write_bytes(URLSET)
+    entries = list(read_sitemap(str(tmp_path / 'sitemap.xml')))
+    assert len(entries) == 2
+    assert 'sitemap-2.txt.gz' in capsys.readouterr().out
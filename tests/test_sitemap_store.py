@@ -0,0 +1,178 @@
+import asyncio
+import gzip
+import importlib
+import os
+import re
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from pysitemap.backends.done import DoneRecord
+from pysitemap.format_processors.xml import XMLWriter
+
+DOMAIN = 'example.com'
+
+
+@pytest.fixture
+def rest(tmp_path, monkeypatch):
+    # pysitemap.rest creates the domain database in the working directory
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('pysitemap.rest')
+
+
+def crawl(directory, urls, lastmod='2024-01-01T00:00:00+00:00'):
+    """
+    Sitemap of urls in shards of two urls, as a crawl job writes it
+    :return: files of the sitemap, the sitemap index last
+    """
+    os.makedirs(directory, exist_ok=True)
+    writer = XMLWriter(os.path.join(directory, DOMAIN + '.xml'), max_urls=2,
+                       base_url='https://sitemaps.example.net/sitemaps/example.com/')
+    asyncio.run(writer.write([(url, DoneRecord(True)) for url in urls]))
+    # Sitemap index lastmod is the time it was written, fix it for the test
+    index = writer.filenames[-1]
+    with open(index) as f:
+        data = re.sub('<lastmod>[^<]*</lastmod>', '<lastmod>{}</lastmod>'.format(lastmod), f.read())
+    with open(index, 'w') as f:
+        f.write(data)
+    return writer.filenames
+
+
+def publish(store, filenames):
+    asyncio.run(store.publish(DOMAIN, filenames))
+
+
+def mtimes(directory):
+    return {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in os.listdir(directory)}
+
+
+def read(path):
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as f:
+        return f.read()
+
+
+URLS = ['https://example.com/{}'.format(i) for i in range(4)]
+
+
+def test_publish(rest, tmp_path):
+    store = rest.SitemapStore(str(tmp_path / 'published'))
+    filenames = crawl(str(tmp_path / 'job1'), URLS)
+    publish(store, filenames)
+    directory = store.directory(DOMAIN)
+    assert sorted(os.listdir(directory)) == [
+        'example.com-1.xml', 'example.com-1.xml.gz', 'example.com-2.xml', 'example.com-2.xml.gz',
+        'example.com.xml', 'example.com.xml.gz']
+    for filename in filenames:
+        published = os.path.join(directory, os.path.basename(filename))
+        assert read(published) == read(filename)
+        assert read(published + '.gz') == read(filename)
+
+
+def test_republish_unchanged_keeps_files(rest, tmp_path):
+    store = rest.SitemapStore(str(tmp_path / 'published'))
+    publish(store, crawl(str(tmp_path / 'job1'), URLS))
+    directory = store.directory(DOMAIN)
+    before = mtimes(directory)
+    # Same urls, index written at another time
+    publish(store, crawl(str(tmp_path / 'job2'), URLS, lastmod='2024-02-01T00:00:00+00:00'))
+    assert mtimes(directory) == before
+    assert b'2024-01-01' in read(os.path.join(directory, 'example.com.xml'))
+
+
+def test_republish_changed_shard_rewrites_index(rest, tmp_path):
+    store = rest.SitemapStore(str(tmp_path / 'published'))
+    publish(store, crawl(str(tmp_path / 'job1'), URLS))
+    directory = store.directory(DOMAIN)
+    before = mtimes(directory)
+    publish(store, crawl(str(tmp_path / 'job2'), URLS[:3] + ['https://example.com/new'],
+                         lastmod='2024-02-01T00:00:00+00:00'))
+    after = mtimes(directory)
+    assert after['example.com-1.xml'] == before['example.com-1.xml']
+    assert after['example.com-2.xml'] != before['example.com-2.xml']
+    assert b'https://example.com/new' in read(os.path.join(directory, 'example.com-2.xml.gz'))
+    # The index tells the shard changed
+    for name in ('example.com.xml', 'example.com.xml.gz'):
+        index = read(os.path.join(directory, name))
+        assert b'2024-02-01' in index and b'2024-01-01' not in index
+
+
+def test_republish_removes_stale_shards_only(rest, tmp_path):
+    store = rest.SitemapStore(str(tmp_path / 'published'))
+    publish(store, crawl(str(tmp_path / 'job1'), URLS + ['https://example.com/4']))
+    directory = store.directory(DOMAIN)
+    assert os.path.exists(os.path.join(directory, 'example.com-3.xml'))
+    with open(os.path.join(directory, 'robots.txt'), 'w') as f:
+        f.write('User-agent: *\n')
+    publish(store, crawl(str(tmp_path / 'job2'), URLS))
+    assert sorted(os.listdir(directory)) == [
+        'example.com-1.xml', 'example.com-1.xml.gz', 'example.com-2.xml', 'example.com-2.xml.gz',
+        'example.com.xml', 'example.com.xml.gz', 'robots.txt']
+
+
+def test_directory_outside_store(rest, tmp_path):
+    store = rest.SitemapStore(str(tmp_path / 'published'))
+    for domain in ('..', '.', '../x', ''):
+        try:
+            store.directory(domain)
+        except ValueError:
+            continue
+        raise AssertionError(domain)
+
+
+def serve(rest, tmp_path, requests):
+    """
+    Publish a sitemap and send requests to the server
+    :param requests: (path, headers) pairs
+    :return: (status, headers, body) of every response
+    """
+    publish_dir = str(tmp_path / 'published')
+    publish(rest.SitemapStore(publish_dir), crawl(str(tmp_path / 'job1'), URLS))
+
+    async def main():
+        app = rest.create_app(out_dir=str(tmp_path / 'jobs'), publish_dir=publish_dir)
+        async with TestClient(TestServer(app)) as client:
+            responses = []
+            for path, headers in requests:
+                resp = await client.get(path, headers=headers, auto_decompress=False)
+                responses.append((resp.status, resp.headers, await resp.read()))
+            return responses
+
+    return asyncio.run(main())
+
+
+def test_serve_conditional_requests(rest, tmp_path):
+    path = '/sitemaps/example.com/example.com-1.xml'
+    (status, headers, body), = serve(rest, tmp_path, [(path, {'Accept-Encoding': 'identity'})])
+    assert status == 200
+    assert body.startswith(b'<?xml')
+    assert headers['Vary'] == 'Accept-Encoding'
+    etag = headers['ETag']
+    responses = serve(rest, tmp_path, [
+        (path, {'Accept-Encoding': 'identity', 'If-None-Match': etag}),
+        (path, {'Accept-Encoding': 'identity', 'If-Modified-Since': headers['Last-Modified']}),
+        (path, {'Accept-Encoding': 'identity', 'If-None-Match': '"other"'}),
+    ])
+    assert [status for status, _headers, _body in responses] == [304, 304, 200]
+    assert responses[0][2] == b''
+
+
+def test_serve_gzip(rest, tmp_path):
+    path = '/sitemaps/example.com/example.com.xml'
+    (status, headers, body), (_status, plain_headers, plain) = serve(
+        rest, tmp_path, [(path, {'Accept-Encoding': 'gzip'}), (path, {'Accept-Encoding': 'identity'})])
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in plain_headers
+    assert gzip.decompress(body) == plain
+    assert headers['ETag'] != plain_headers['ETag']
+
+
+def test_serve_missing(rest, tmp_path):
+    responses = serve(rest, tmp_path, [
+        ('/sitemaps/example.com/missing.xml', {}),
+        ('/sitemaps/example.com/example.com.xml.tmp', {}),
+        ('/sitemaps/example.com/.hidden', {}),
+        ('/sitemaps/other.example.com/example.com.xml', {}),
+        ('/sitemaps/..%2F..%2Fetc/passwd', {}),
+    ])
+    assert [status for status, _headers, _body in responses] == [404] * 5
@@ -0,0 +1,34 @@
+from pysitemap.backends.sqlite_todo import SQLiteTodo
+
+
+def test_add_remove(tmp_path):
+    todo = SQLiteTodo(str(tmp_path / 'todo.db'))
+    for i in range(3):
+        todo.add('https://example.com/{}'.format(i))
+    todo.add('https://example.com/0')
+    todo.remove('https://example.com/1')
+    assert len(todo) == 2
+    assert 'https://example.com/0' in todo
+    assert 'https://example.com/1' not in todo
+    assert sorted(todo) == ['https://example.com/0', 'https://example.com/2']
+    todo.close()
+
+
+def test_pending_writes_survive_close(tmp_path):
+    path = str(tmp_path / 'todo.db')
+    todo = SQLiteTodo(path, batch_size=1000)
+    for i in range(10):
+        todo.add('https://example.com/{}'.format(i))
+    todo.close()
+    todo = SQLiteTodo(path, reset=False)
+    assert len(todo) == 10
+    todo.close()
+    assert len(SQLiteTodo(path)) == 0
+
+
+def test_flush(tmp_path):
+    path = str(tmp_path / 'todo.db')
+    todo = SQLiteTodo(path, batch_size=1000)
+    todo.add('https://example.com/')
+    todo.flush()
+    assert len(SQLiteTodo(path, reset=False)) == 1
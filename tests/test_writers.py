@@ -0,0 +1,177 @@
+import asyncio
+import gzip
+import os
+import zlib
+
+from pysitemap.backends.done import DoneRecord
+from pysitemap.format_processors.compressed import TextGzipWriter, XMLGzipWriter
+from pysitemap.format_processors.text import TextWriter
+from pysitemap.format_processors.xml import XMLWriter
+from pysitemap.parsers import SitemapParser, read_sitemap
+
+
+def entries(count):
+    return [('https://example.com/page/{}'.format(i), DoneRecord(True)) for i in range(count)]
+
+
+def write(writer, urls):
+    asyncio.run(writer.write(urls))
+    return writer
+
+
+def parse_file(filename):
+    parser = SitemapParser()
+    with open(filename, 'rb') as f:
+        parser.feed(f.read())
+    parser.close()
+    return [url for url, _record in parser.pop_urls()], parser.pop_sitemaps()
+
+
+def test_single_file(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    writer = write(XMLWriter(filename, buffer_size=100), entries(10))
+    assert writer.filenames == [filename]
+    assert sorted(os.listdir(tmp_path)) == ['sitemap.xml']
+    urls, sitemaps = parse_file(filename)
+    assert urls == [url for url, _record in entries(10)]
+    assert sitemaps == []
+
+
+def test_entry_fields(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    record = DoneRecord(True, 'Tue, 02 Jan 2024 03:04:05 GMT', 'daily', 0.5,
+                        [{'src': 'https://example.com/a.png?x=1&y=2', 'title': 'A & B'}])
+    write(XMLWriter(filename), [('https://example.com/?a=1&b=2', record)])
+    (url, parsed), = list(read_sitemap(filename))
+    assert url == 'https://example.com/?a=1&b=2'
+    assert parsed.lastmod == '2024-01-02T03:04:05+00:00'
+    assert (parsed.changefreq, parsed.priority) == ('daily', '0.5')
+    assert parsed.images == ({'src': 'https://example.com/a.png?x=1&y=2', 'title': 'A & B'},)
+
+
+def test_shards_by_url_count(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    writer = write(XMLWriter(filename, max_urls=4, base_url='https://example.com/maps/'), entries(10))
+    shards = [str(tmp_path / 'sitemap-{}.xml'.format(i)) for i in (1, 2, 3)]
+    assert writer.filenames == shards + [filename]
+    assert sorted(os.listdir(tmp_path)) == ['sitemap-1.xml', 'sitemap-2.xml', 'sitemap-3.xml', 'sitemap.xml']
+    assert [len(parse_file(shard)[0]) for shard in shards] == [4, 4, 2]
+    urls, sitemaps = parse_file(filename)
+    assert urls == []
+    assert sitemaps == ['https://example.com/maps/sitemap-{}.xml'.format(i) for i in (1, 2, 3)]
+    assert [url for url, _record in read_sitemap(filename)] == [url for url, _record in entries(10)]
+
+
+def test_shards_by_size(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    writer = XMLWriter(filename, max_bytes=1000, buffer_size=64)
+    write(writer, entries(50))
+    assert len(writer.shards) > 1
+    for shard in writer.shards:
+        assert os.path.getsize(shard) <= 1000
+    assert len(list(read_sitemap(filename))) == 50
+
+
+def test_exact_fit_is_not_split(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    writer = write(XMLWriter(filename, max_urls=5), entries(5))
+    assert writer.filenames == [filename]
+
+
+def test_text_shards_get_xml_index(tmp_path):
+    filename = str(tmp_path / 'sitemap.txt')
+    writer = write(TextWriter(filename, max_urls=3), entries(7))
+    index = str(tmp_path / 'sitemap-index.xml')
+    assert writer.filenames == [str(tmp_path / 'sitemap-{}.txt'.format(i)) for i in (1, 2, 3)] + [index]
+    with open(str(tmp_path / 'sitemap-1.txt')) as f:
+        assert f.read() == ''.join('https://example.com/page/{}\n'.format(i) for i in range(3))
+    assert len(list(read_sitemap(index))) == 7
+
+
+def test_text_index_of_other_extensions(tmp_path):
+    for name, shard, index in (('urls.list', 'urls-1.list', 'urls-index.xml'),
+                               ('sitemap', 'sitemap-1', 'sitemap-index.xml')):
+        writer = write(TextWriter(str(tmp_path / name), max_urls=3), entries(4))
+        assert writer.filenames == [str(tmp_path / shard), str(tmp_path / shard.replace('-1', '-2')),
+                                    str(tmp_path / index)]
+        assert len(list(read_sitemap(str(tmp_path / index)))) == 4
+
+
+def test_incomplete_output_is_not_published(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml')
+    writer = XMLWriter(filename, max_urls=4)
+
+    async def main():
+        await writer.open()
+        for url, record in entries(6):
+            await writer.add(url, record)
+        await writer.close(complete=False)
+
+    asyncio.run(main())
+    assert sorted(os.listdir(tmp_path)) == ['sitemap-1.xml.tmp', 'sitemap-2.xml.tmp']
+
+
+def test_gzip(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml.gz')
+    writer = write(XMLGzipWriter(filename, buffer_size=100), entries(100))
+    assert writer.filenames == [filename]
+    with gzip.open(filename) as f:
+        data = f.read()
+    assert data.startswith(b'<?xml') and data.endswith(b'</urlset>')
+    assert [url for url, _record in read_sitemap(filename)] == [url for url, _record in entries(100)]
+    # Compressed in blocks as they are flushed, into a single gzip member
+    decompressor = zlib.decompressobj(31)
+    with open(filename, 'rb') as f:
+        assert decompressor.decompress(f.read()) == data
+    assert decompressor.eof and decompressor.unused_data == b''
+    assert os.path.getsize(filename) < len(data)
+
+
+def test_gzip_shards(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml.gz')
+    writer = write(XMLGzipWriter(filename, max_urls=4, base_url='https://example.com/'), entries(10))
+    shards = [str(tmp_path / 'sitemap-{}.xml.gz'.format(i)) for i in (1, 2, 3)]
+    assert writer.filenames == shards + [filename]
+    with gzip.open(filename) as f:
+        assert f.read().startswith(b'<?xml')
+    assert len(list(read_sitemap(filename))) == 10
+
+
+def test_gzip_max_bytes_is_uncompressed_size(tmp_path):
+    filename = str(tmp_path / 'sitemap.xml.gz')
+    writer = write(XMLGzipWriter(filename, max_bytes=1000), entries(50))
+    assert len(writer.shards) > 1
+    for shard in writer.shards:
+        with gzip.open(shard) as f:
+            assert len(f.read()) <= 1000
+
+
+def test_text_gzip_shards(tmp_path):
+    filename = str(tmp_path / 'sitemap.txt.gz')
+    writer = write(TextGzipWriter(filename, max_urls=5), entries(7))
+    index = str(tmp_path / 'sitemap-index.xml.gz')
+    assert writer.filenames == [str(tmp_path / 'sitemap-1.txt.gz'), str(tmp_path / 'sitemap-2.txt.gz'), index]
+    with gzip.open(str(tmp_path / 'sitemap-2.txt.gz')) as f:
+        assert f.read() == b'https://example.com/page/5\nhttps://example.com/page/6\n'
+    assert len(list(read_sitemap(index))) == 7
+
+
+def test_gzip_filenames(tmp_path):
+    for writer_class, name, shard, index in (
+            (XMLGzipWriter, 'sitemap.xml', 'sitemap-1.xml.gz', 'sitemap.xml.gz'),
+            (TextGzipWriter, 'sitemap.txt', 'sitemap-1.txt.gz', 'sitemap-index.xml.gz'),
+            (TextGzipWriter, 'urls.gz', 'urls-1.gz', 'urls-index.xml.gz'),
+            (TextGzipWriter, 'urls', 'urls-1.gz', 'urls-index.xml.gz')):
+        writer = write(writer_class(str(tmp_path / name), max_urls=3), entries(4))
+        assert writer.filenames == [str(tmp_path / shard), str(tmp_path / shard.replace('-1', '-2')),
+                                    str(tmp_path / index)]
+        for filename in writer.filenames:
+            with open(filename, 'rb') as f:
+                assert f.read(2) == b'\x1f\x8b'
+        assert len(list(read_sitemap(str(tmp_path / index)))) == 4
+
+
+def test_gzip_single_file_gets_gz_extension(tmp_path):
+    writer = write(XMLGzipWriter(str(tmp_path / 'sitemap.xml')), entries(2))
+    assert writer.filenames == [str(tmp_path / 'sitemap.xml.gz')]
+    assert os.listdir(tmp_path) == ['sitemap.xml.gz']